@@ -0,0 +1,92 @@
+import argparse
+import time
+
+from whilelang.nodes import (
+    SuiteNode, IfNode, WhileNode, SkipNode, AssignNode, ConstantNode,
+    VariableNode, AddNode, CmpNode
+)
+from whilelang.numeric import stmt_from_num
+
+# The programs are built directly rather than parsed, as the parser can't
+# handle nesting as deep as these go
+
+
+def long_suite(size):
+    # Each statement's number becomes an exponent, so these are kept small
+    return SuiteNode([
+        (
+            AssignNode("x", ConstantNode(1)),
+            AssignNode("y", VariableNode("x")),
+            SkipNode(),
+        )[i % 3]
+        for i in range(size)
+    ])
+
+
+def nested_whiles(size):
+    node = AssignNode("x", AddNode(VariableNode("x"), ConstantNode(1)))
+    for _ in range(size):
+        node = WhileNode(
+            CmpNode(VariableNode("x"), "<=", ConstantNode(3)), node
+        )
+    return node
+
+
+def else_chain(size):
+    # Only the else branches nest, as a nested then branch, or condition,
+    # grows the number exponentially rather than linearly
+    node = SkipNode()
+    for _ in range(size):
+        node = IfNode(
+            CmpNode(VariableNode("x"), "<=", ConstantNode(1)),
+            AssignNode("x", ConstantNode(1)),
+            node,
+        )
+    return node
+
+
+PROGRAMS = {
+    "suite": long_suite,
+    "while": nested_whiles,
+    "else": else_chain,
+}
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check Gödel numbers round trip exactly, and time them"
+    )
+    parser.add_argument(
+        "-s", "--sizes", type=int, nargs="+", default=[100, 1000, 10000],
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'program':<8} {'size':>6} {'bits':>12} "
+        f"{'encode':>10} {'decode':>10} {'re-encode':>10}"
+    )
+    for name, generate in PROGRAMS.items():
+        for size in args.sizes:
+            ast = generate(size)
+
+            num, encode = timed(ast.numeric)
+            decoded, decode = timed(stmt_from_num, num)
+            again, reencode = timed(decoded.numeric)
+            if again != num:
+                raise AssertionError(f"{name} {size} did not round trip")
+
+            print(
+                f"{name:<8} {size:>6} {num.bit_length():>12} "
+                f"{encode * 1000:>8.1f}ms {decode * 1000:>8.1f}ms "
+                f"{reencode * 1000:>8.1f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
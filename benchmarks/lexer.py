@@ -0,0 +1,59 @@
+import argparse
+import random
+import time
+
+from whilelang.lexer import Lexer, RegexLexer
+
+
+def generate(statements, seed=0):
+    rng = random.Random(seed)
+    names = ["x", "y", "z", "counter", "_arg0", "_arg1"]
+    lines = []
+    for _ in range(statements):
+        name = rng.choice(names)
+        lhs, rhs = rng.sample(names, 2)
+        number = rng.randint(0, 10 ** rng.randint(1, 12))
+        lines.append(rng.choice((
+            f"{name} := {lhs} + {number} * ({rhs} - 1);",
+            f"if ({lhs} <= {number}) & ¬({rhs} = {lhs}) then skip;",
+            f"while {lhs} >= {rhs} do ({name} := {name} - 1);",
+            f"// {name} is updated here\n{name} := {lhs};",
+            "@print x;",
+        )))
+    return "\n".join(lines)
+
+
+def bench(cls, source, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        tokens = sum(1 for _ in cls(source))
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return tokens, best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare lexer throughput in tokens per second"
+    )
+    parser.add_argument("-s", "--statements", type=int, default=20000)
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    source = generate(args.statements)
+    print(f"Source: {len(source)} characters")
+
+    results = {}
+    for cls in (Lexer, RegexLexer):
+        tokens, duration = bench(cls, source, args.repeat)
+        results[cls] = duration
+        print(
+            f"{cls.__name__:<12} {tokens} tokens in {duration * 1000:.1f}ms "
+            f"({tokens / duration:,.0f} tokens/s)"
+        )
+    print(f"Speedup: {results[Lexer] / results[RegexLexer]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import random
+import gc
+import tracemalloc
+
+from whilelang.lexer import RegexLexer
+from whilelang.optimise import count_nodes
+from whilelang.parser import Parser
+
+
+def generate(statements, seed=0):
+    # Unlike the lexer benchmark's programs, these have to parse, so if and
+    # while statements are bracketed to stop them absorbing what follows
+    rng = random.Random(seed)
+    names = ["x", "y", "z", "counter"]
+    lines = []
+    for _ in range(statements):
+        name = rng.choice(names)
+        lhs, rhs = rng.sample(names, 2)
+        number = rng.randint(0, 1000)
+        lines.append(rng.choice((
+            f"{name} := {lhs} + {number} * ({rhs} - 1)",
+            f"(if ({lhs} <= {number}) & ¬({rhs} = {lhs}) then skip)",
+            f"(while {lhs} >= {rhs} do ({name} := {name} - 1))",
+            f"{name} := {lhs}",
+        )))
+    return ";\n".join(lines)
+
+
+def measure(build):
+    # Bytes still allocated once build() returns, along with its result
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the memory used by tokens and AST nodes"
+    )
+    parser.add_argument("-s", "--statements", type=int, default=20000)
+    args = parser.parse_args()
+
+    source = generate(args.statements)
+    print(f"Source: {len(source)} characters")
+
+    tokens, size = measure(lambda: list(RegexLexer(source)))
+    print(
+        f"Tokens: {len(tokens)} using {size:,} bytes "
+        f"({size / len(tokens):.1f} bytes per token)"
+    )
+    del tokens
+
+    ast, size = measure(lambda: Parser(RegexLexer(source)).program())
+    nodes = count_nodes(ast)
+    print(
+        f"AST:    {nodes} nodes using {size:,} bytes "
+        f"({size / nodes:.1f} bytes per node)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import argparse
+import random
+import timeit
+
+from whilelang.util import phi, phi_prime
+
+
+def reference_phi(n, m):
+    return (2 ** n) * (2 * m + 1) - 1
+
+
+def reference_phi_prime(x):
+    n = 0
+    m = int(x) + 1
+    while m % 2 == 0 and m > 0:
+        n += 1
+        m >>= 1
+    m = (m - 1) // 2
+
+    return n, m
+
+
+def best(func, *args, number):
+    return min(timeit.repeat(
+        lambda: func(*args), number=number, repeat=3
+    )) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time phi and phi_prime on numbers of increasing size"
+    )
+    parser.add_argument(
+        "--max-bits", type=int, default=10 ** 6,
+        help="Size of the largest numbers to time",
+    )
+    parser.add_argument(
+        "--max-reference-bits", type=int, default=10 ** 5,
+        help=(
+            "Size of the largest numbers to time the reference "
+            "implementations on, which take quadratic time"
+        ),
+    )
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print(
+        f"{'bits':>8}  {'phi':>10}  {'reference':>10}  "
+        f"{'phi_prime':>10}  {'reference':>10}"
+    )
+    bits = 10
+    while bits <= args.max_bits:
+        # Half of the bits go to each of phi's arguments, which is the
+        # worst case for phi_prime as it has to strip n trailing zeros
+        n = bits // 2
+        m = rng.getrandbits(bits - n)
+        x = phi(n, m)
+        assert phi_prime(x) == (n, m)
+        number = max(1, 10 ** 6 // bits)
+
+        row = [best(phi, n, m, number=number)]
+        row.append(best(reference_phi, n, m, number=number))
+        row.append(best(phi_prime, x, number=number))
+        if bits <= args.max_reference_bits:
+            assert reference_phi_prime(x) == (n, m)
+            row.append(best(reference_phi_prime, x, number=1))
+        else:
+            row.append(None)
+
+        print(f"{bits:>8}  " + "  ".join(
+            f"{'-':>10}" if i is None else f"{i * 10 ** 6:>8.2f}us"
+            for i in row
+        ))
+        bits *= 10
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import argparse
+import platform
+import statistics
+import json
+import time
+import sys
+import gc
+import os
+
+from whilelang.lexer import RegexLexer, Replay
+from whilelang.parser import Parser
+from whilelang.optimise import Optimiser
+from whilelang.main import ENGINES
+from whilelang.numeric import stmt_from_num, ENCODE_CACHE, DECODE_CACHE
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+# Errors the encoder raises for programs it can't give a number to, such as
+# those using names other than x, y and z, or whose number would be too big
+UNENCODABLE = (ValueError, OverflowError, NotImplementedError)
+# Phases quicker than this are run several times over for each sample, so
+# that timer resolution and noise don't swamp them
+MIN_SAMPLE = 0.02
+
+
+def load(name):
+    path = os.path.join(CORPUS, name)
+    with open(path, encoding="utf-8") as file_:
+        text = file_.read()
+    if name.endswith(".num"):
+        return int("".join(
+            line for line in text.splitlines() if not line.startswith("//")
+        ))
+    return text
+
+
+def sample(func, setup, number):
+    # Average time of a call to func in seconds, not counting setup
+    total = 0
+    gc_enabled = gc.isenabled()
+    for _ in range(number):
+        if setup is not None:
+            setup()
+        gc.disable()
+        try:
+            start = time.perf_counter_ns()
+            result = func()
+            total += time.perf_counter_ns() - start
+        finally:
+            if gc_enabled:
+                gc.enable()
+    return result, total / number / 1e9
+
+
+def timed(repeat, func, setup=None):
+    result, first = sample(func, setup, 1)
+    number = max(1, min(10000, int(MIN_SAMPLE / max(first, 1e-9))))
+
+    times = []
+    for _ in range(repeat):
+        result, duration = sample(func, setup, number)
+        times.append(duration)
+    return result, {
+        "number": number,
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.mean(times),
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+    }
+
+
+def bench(name, repeat, engine, optimise):
+    phases = {}
+    source = load(name)
+
+    if isinstance(source, int):
+        ast, phases["decode"] = timed(
+            repeat, lambda: stmt_from_num(source), DECODE_CACHE.clear
+        )
+    else:
+        tokens, phases["lex"] = timed(
+            repeat, lambda: list(RegexLexer(source))
+        )
+        ast, phases["parse"] = timed(
+            repeat, lambda: Parser(Replay(source, tokens)).program()
+        )
+
+    optimised = Optimiser(optimise).optimise(ast)
+    program, phases["compile"] = timed(
+        repeat, lambda: ENGINES[engine](optimised)
+    )
+    _, phases["execute"] = timed(repeat, lambda: program({}))
+
+    try:
+        _, phases["numeric"] = timed(repeat, ast.numeric, ENCODE_CACHE.clear)
+    except UNENCODABLE as e:
+        phases["numeric"] = {"error": f"{type(e).__name__}: {e}"}
+    return phases
+
+
+def compare(baseline, results, threshold):
+    # Compares the fastest run of each phase, as the least noisy measure
+    regressions = 0
+    for name, phases in results.items():
+        for phase, stats in phases.items():
+            old = baseline.get(name, {}).get(phase, {})
+            if "min" not in stats or "min" not in old:
+                continue
+            ratio = stats["min"] / old["min"] if old["min"] else 1
+            flag = ""
+            if ratio > 1 + threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            elif ratio < 1 - threshold:
+                flag = "  improved"
+            print(f"{name:<20} {phase:<8} {ratio:>8.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Time each phase of running the programs in the corpus, "
+            "optionally comparing against an earlier run"
+        )
+    )
+    parser.add_argument(
+        "programs", nargs="*",
+        help="Corpus files to run. Defaults to all of them",
+    )
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument("-e", "--engine", choices=ENGINES, default="compile")
+    parser.add_argument(
+        "-O", dest="optimise", type=int, choices=Optimiser.LEVELS, default=0,
+        metavar="LEVEL",
+    )
+    parser.add_argument(
+        "-o", "--output", default=None,
+        help="File to write the results to as JSON",
+    )
+    parser.add_argument(
+        "-c", "--compare", default=None, metavar="BASELINE",
+        help="JSON results of an earlier run to compare against",
+    )
+    parser.add_argument(
+        "-t", "--threshold", type=float, default=0.1,
+        help="How much slower a phase may get before it's a regression",
+    )
+    args = parser.parse_args()
+
+    # Decoded programs are printed in full, and can be very long
+    if hasattr(sys, "set_int_max_str_digits"):
+        sys.set_int_max_str_digits(0)
+
+    programs = args.programs or sorted(os.listdir(CORPUS))
+    results = {}
+    print(f"{'program':<20} {'phase':<8} {'min':>10} {'median':>10} "
+          f"{'stdev':>10}")
+    for name in programs:
+        results[name] = bench(name, args.repeat, args.engine, args.optimise)
+        for phase, stats in results[name].items():
+            if "error" in stats:
+                print(f"{name:<20} {phase:<8} {stats['error'][:40]}")
+                continue
+            print(
+                f"{name:<20} {phase:<8} {stats['min'] * 1000:>8.3f}ms "
+                f"{stats['median'] * 1000:>8.3f}ms "
+                f"{stats['stdev'] * 1000:>8.3f}ms"
+            )
+
+    if args.output is not None:
+        with open(args.output, "w") as file_:
+            json.dump({
+                "python": platform.python_version(),
+                "engine": args.engine,
+                "optimise": args.optimise,
+                "repeat": args.repeat,
+                "results": results,
+            }, file_, indent=2, sort_keys=True)
+
+    if args.compare is not None:
+        with open(args.compare) as file_:
+            baseline = json.load(file_)
+        if (baseline["engine"], baseline["optimise"]) != (
+            args.engine, args.optimise
+        ):
+            print("Warning: baseline was run with a different engine or "
+                  "optimisation level")
+        print()
+        if compare(baseline["results"], results, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -26,5 +26,8 @@ setuptools.setup(
         "scripts/while.py"
     ],
     packages=["whilelang"],
+    extras_require={
+        "vector": ["numpy"],
+    },
     python_requires=">=3.8",
 )
@@ -0,0 +1,58 @@
+import unittest
+
+from whilelang.batch import run_batch
+from whilelang.lexer import RegexLexer
+from whilelang.optimise import Optimiser
+from whilelang.parser import Parser
+from whilelang.vector import numpy
+
+
+COUNTER = """
+x := 1;
+while (_arg0 > 0) do (
+    x := x + 1;
+    _arg0 := _arg0 - 1
+)
+"""
+
+
+class BatchTest(unittest.TestCase):
+    def _run(self, code, rows, optimise=0, **kwargs):
+        ast = Parser(RegexLexer(code)).program()
+        ast = Optimiser(optimise).optimise(ast)
+        return list(run_batch(ast, rows, **kwargs))
+
+    def test_rows(self):
+        results = self._run(COUNTER, [["3"], ["5"]])
+        self.assertEqual(
+            [result["namespace"] for result in results],
+            [{"x": 4}, {"x": 6}],
+        )
+
+    @unittest.skipIf(numpy is None, "NumPy isn't installed")
+    def test_vector_induction_loop(self):
+        # Stepped through a lane at a time, this loop would never finish
+        # within the timeout
+        results = self._run(
+            COUNTER, [["1000000000000"], ["5"]], optimise=2, timeout=5,
+            vector=True,
+        )
+        self.assertEqual(
+            [result["status"] for result in results], ["halted", "halted"]
+        )
+        self.assertEqual(
+            [result["namespace"] for result in results],
+            [{"x": 1000000000001}, {"x": 6}],
+        )
+
+    @unittest.skipIf(numpy is None, "NumPy isn't installed")
+    def test_vector_matches_scalar(self):
+        rows = [[str(i)] for i in range(20)]
+        self.assertEqual(
+            [r["namespace"] for r in self._run(COUNTER, rows, vector=True)],
+            [r["namespace"] for r in self._run(COUNTER, rows)],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+from whilelang.nodes import (
+    AssignNode, AddNode, CmpNode, ConstantNode, IfNode, NotNode, SkipNode,
+    SuiteNode, VariableNode, WhileNode
+)
+from whilelang.vm import compile_vm
+
+
+# Deeper than Python's default recursion limit allows for a compiler that
+# recurses through the tree
+DEPTH = 3000
+
+
+class VMTest(unittest.TestCase):
+    def test_nested_loops(self):
+        node = AssignNode("x", AddNode(VariableNode("x"), ConstantNode(1)))
+        for _ in range(DEPTH):
+            node = WhileNode(
+                CmpNode(VariableNode("x"), "<", ConstantNode(1)), node
+            )
+        namespace = {}
+        compile_vm(node)(namespace)
+        self.assertEqual(namespace, {"x": 1})
+
+    def test_nested_expressions(self):
+        expr = VariableNode("x")
+        for i in range(DEPTH):
+            if i % 2:
+                expr = AddNode(ConstantNode(1), expr)
+            else:
+                expr = NotNode(CmpNode(expr, ">", ConstantNode(-1)))
+        node = SuiteNode([
+            AssignNode("x", ConstantNode(0)), AssignNode("y", expr)
+        ])
+        for _ in range(DEPTH):
+            node = IfNode(ConstantNode(True), node, SkipNode())
+        namespace = {}
+        compile_vm(node)(namespace)
+        self.assertEqual(namespace, {"x": 0, "y": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
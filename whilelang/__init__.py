@@ -1 +1,2 @@
 from .main import main, run
+from .aio import run_async
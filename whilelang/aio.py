@@ -0,0 +1,115 @@
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import time
+
+from .lexer import RegexLexer
+from .parser import Parser
+from .optimise import Optimiser
+from .nodes import ASTNode
+from .limits import LimitedNamespace
+from .errors import WhileError, WhileSystemExit, WhileCancelledError
+
+# How many loop iterations a program runs between checks for cancellation
+INTERVAL = 1000
+
+
+class CancellableNamespace(LimitedNamespace):
+    # A LimitedNamespace which can also be stopped from another thread, by
+    # setting cancelled. It's checked every interval steps, which is also
+    # when the thread running the program lets others have the GIL.
+    def __init__(
+        self, values=(), max_steps=None, timeout=None, interval=INTERVAL
+    ):
+        super().__init__(values, max_steps, timeout)
+        self.interval = interval
+        self.cancelled = False
+
+    def _check(self):
+        if self.cancelled:
+            raise WhileCancelledError("Cancelled", self)
+        # Gives the event loop's thread the chance to take the GIL
+        time.sleep(0)
+        return min(super()._check(), self.steps + self.interval)
+
+
+def _run(code, namespace, engine, optimise):
+    # Runs code against namespace, returning how long it took in ns, as
+    # run() does, but raising any error rather than printing it
+    from .main import ENGINES
+
+    if isinstance(code, ASTNode):
+        ast = code
+    else:
+        ast = Parser(RegexLexer(code)).program()
+
+    start = time.perf_counter_ns()
+    ast = Optimiser(optimise).optimise(ast)
+    program = ENGINES[engine](ast)
+    try:
+        program(namespace)
+    except WhileSystemExit:
+        pass
+    return time.perf_counter_ns() - start
+
+
+def _run_in_process(code, namespace, engine, optimise, max_steps, timeout):
+    # Errors are returned rather than raised, so the namespace they left
+    # still makes it back
+    limited = LimitedNamespace(namespace, max_steps, timeout)
+    duration = error = None
+    try:
+        duration = _run(code, limited, engine, optimise)
+    except (WhileError, Exception) as e:
+        error = e
+    return dict(limited), duration, error
+
+
+async def run_async(
+    code, namespace=None, engine="compile", optimise=0, max_steps=None,
+    timeout=None, interval=INTERVAL, executor=None
+):
+    # Runs code without blocking the event loop, returning the namespace it
+    # leaves and how long it took in ns. Errors are raised rather than
+    # printed, and the namespace is left as it was when they were.
+    #
+    # By default the program runs on a thread of the loop's default executor,
+    # or of executor if it's a ThreadPoolExecutor, and stops at the next
+    # loop iteration when the task running it is cancelled. A
+    # ProcessPoolExecutor runs it in another process instead, where it no
+    # longer holds up the loop's thread at all, but once it has started it
+    # can only be stopped by max_steps or timeout.
+    if namespace is None:
+        namespace = {}
+    loop = asyncio.get_running_loop()
+
+    if isinstance(executor, ProcessPoolExecutor):
+        values, duration, error = await loop.run_in_executor(
+            executor, _run_in_process, code, dict(namespace), engine,
+            optimise, max_steps, timeout,
+        )
+        namespace.clear()
+        namespace.update(values)
+        if error is not None:
+            raise error
+        return namespace, duration
+
+    limited = CancellableNamespace(namespace, max_steps, timeout, interval)
+    future = loop.run_in_executor(
+        executor, _run, code, limited, engine, optimise
+    )
+    try:
+        duration = await asyncio.shield(future)
+    except asyncio.CancelledError:
+        limited.cancelled = True
+        # The thread can't be stopped outright, so wait for the program to
+        # notice, after which nothing else will change the namespace
+        await asyncio.wait([future])
+        if not future.cancelled():
+            # Most likely WhileCancelledError, which isn't worth reporting
+            future.exception()
+        raise
+    finally:
+        if future.done():
+            namespace.clear()
+            namespace.update(limited)
+    return namespace, duration
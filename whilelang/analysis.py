@@ -0,0 +1,138 @@
+from .nodes import (
+    SuiteNode, IfNode, WhileNode, AssignNode, SkipNode, ConstantNode,
+    VariableNode, AddNode, SubNode, MulNode, CmpNode, EqNode,
+    InductionLoopNode
+)
+
+
+def statements(node):
+    # Every statement nested within node, including node itself
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        if isinstance(node, SuiteNode):
+            stack.extend(reversed(node.statements))
+        elif isinstance(node, IfNode):
+            if node.else_body is not None:
+                stack.append(node.else_body)
+            stack.append(node.body)
+        elif isinstance(node, WhileNode):
+            stack.append(node.body)
+
+
+def evaluated(node):
+    # The expressions a single statement evaluates itself, leaving out any
+    # evaluated by statements nested within it. Loops the optimiser has
+    # replaced with their closed form are treated as a single opaque
+    # expression.
+    if isinstance(node, InductionLoopNode):
+        return (node, )
+    if isinstance(node, (IfNode, WhileNode)):
+        return (node.condition, )
+    if isinstance(node, AssignNode):
+        return (node.value, )
+    if isinstance(node, (SuiteNode, SkipNode)):
+        return ()
+    return (node, )
+
+
+def expressions(node):
+    # Every expression evaluated directly by statements within node
+    for i in statements(node):
+        yield from evaluated(i)
+
+
+def leading_assigns(node):
+    # Variables that executing node is certain to assign before it could
+    # first assign any other variable, in order. Any of these not yet in the
+    # namespace can safely be inserted up front without changing the order
+    # variables are first assigned in. Loops could be stopped by a step limit
+    # part way through, so nothing after one counts.
+    names = []
+    for i in statements(node):
+        if isinstance(i, AssignNode):
+            names.append(i.name)
+        elif isinstance(i, WhileNode):
+            break
+        elif isinstance(i, IfNode):
+            if any(
+                isinstance(j, (AssignNode, WhileNode)) for j in statements(i)
+            ):
+                break
+    return list(dict.fromkeys(names))
+
+
+def linear(node):
+    # Express an arithmetic expression as a mapping of variable name (None
+    # for the constant term) to coefficient, or None if it isn't linear
+    if isinstance(node, ConstantNode):
+        if type(node.value) is not int:
+            return None
+        return {None: node.value}
+    if isinstance(node, VariableNode):
+        return {node.name: 1}
+    if not isinstance(node, (AddNode, SubNode, MulNode)):
+        return None
+
+    lhs, rhs = linear(node.lhs), linear(node.rhs)
+    if lhs is None or rhs is None:
+        return None
+
+    if isinstance(node, MulNode):
+        if set(lhs) == {None}:
+            lhs, rhs = rhs, lhs
+        if set(rhs) != {None}:
+            return None
+        return {name: coeff * rhs[None] for name, coeff in lhs.items()}
+
+    sign = 1 if isinstance(node, AddNode) else -1
+    form = dict(lhs)
+    for name, coeff in rhs.items():
+        form[name] = form.get(name, 0) + sign * coeff
+    return form
+
+
+def induction_loop(node):
+    # Recognise a while loop whose body only increments variables by
+    # loop-invariant amounts, and whose condition compares two linear
+    # expressions, so the number of iterations can be computed directly
+    if isinstance(node.body, SuiteNode):
+        body = list(statements(node.body))[1:]
+    else:
+        body = [node.body]
+
+    steps = []
+    for i in body:
+        if isinstance(i, (SuiteNode, SkipNode)):
+            continue
+        if not isinstance(i, AssignNode):
+            return None
+        form = linear(i.value)
+        if form is None or form.get(i.name) != 1:
+            return None
+        form.pop(i.name)
+        steps.append((i.name, form))
+
+    assigned = [name for name, _ in steps]
+    if len(set(assigned)) != len(assigned):
+        return None
+    if any(name in assigned for _, step in steps for name in step):
+        return None
+
+    if isinstance(node.condition, CmpNode):
+        mode = node.condition.mode
+        if mode not in CmpNode.OPERATORS:
+            return None
+    elif isinstance(node.condition, EqNode):
+        mode = "="
+    else:
+        return None
+
+    delta = linear(SubNode(node.condition.lhs, node.condition.rhs))
+    if delta is None:
+        return None
+
+    return InductionLoopNode(
+        node.condition, node.body, mode, delta, steps, node.location
+    )
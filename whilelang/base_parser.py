@@ -3,8 +3,12 @@ from .errors import WhileSyntaxError
 
 
 class BaseParser:
-    def __init__(self, lexer):
+    def __init__(self, lexer, recover=False):
         self._lex = lexer
+        # Whether syntax errors are collected, skipping to the end of the
+        # offending statement, rather than stopping at the first one
+        self._recover = recover
+        self._errors = []
         self._cur = next(lexer)
         self._next = next(lexer)
 
@@ -14,7 +18,7 @@ class BaseParser:
 
         error = f"Syntax error at line {token.location[0] + 1}\n"
         error += "  " + message + "\n"
-        error += self._lex._text.split("\n")[token.location[0]] + "\n"
+        error += self._lex.source.line(token.location[0]) + "\n"
         if not token.length:
             error += " " * (token.location[1] - 1) + "^"
         else:
@@ -22,30 +26,37 @@ class BaseParser:
                 " " * (token.location[1] - token.length - 1)
                 + "^" + "~" * (token.length - 1)
             )
-        raise WhileSyntaxError(error)
+        raise WhileSyntaxError(error, token.location)
+
+    @property
+    def errors(self):
+        errors = self._errors + getattr(self._lex, "errors", [])
+        return sorted(errors, key=lambda error: error.location)
 
     def eat(self, token=None, meta=None):
-        if token is not None and self._cur.type != token:
+        last = self._cur
+        if token is not None and last.type != token:
             self._error(
-                f"Unexpected '{self._cur.type}' at this time. "
+                f"Unexpected '{last.type}' at this time. "
                 f"Expected '{token}'."
             )
-        if meta is not None and self._cur.meta != meta:
+        if meta is not None and last.meta != meta:
             self._error(
-                f"Unexpected '{self._cur.type} {self._cur.meta}' "
+                f"Unexpected '{last.type} {last.meta}' "
                 f"at this time. Expected '{token} {meta}'."
             )
-        last = self._cur
         self._cur = self._next
         self._next = next(self._lex)
         return last
 
     def try_eat(self, token, meta=None):
-        if self._cur.type != token:
+        cur = self._cur
+        if cur.type != token:
             return False
-        if meta is not None and self._cur.meta != meta:
+        if meta is not None and cur.meta != meta:
             return False
-        self.eat(token, meta)
+        # Already known to match, so there is nothing left to check
+        self.eat()
         return True
 
     def eat_list(self, matcher):
@@ -0,0 +1,302 @@
+from concurrent.futures import ProcessPoolExecutor
+import collections
+import contextlib
+import itertools
+import argparse
+import json
+import time
+import csv
+import sys
+import io
+import os
+
+from .errors import WhileError, WhileSystemExit, WhileLimitError
+from .vector import compile_vector, VectorProgram
+
+# The compiled program, built once by each worker process
+_program = None
+
+
+def row_namespace(row):
+    # CSV rows arrive as a list of fields, which are positional arguments.
+    # JSON lines are either an array of positional arguments, or an object
+    # mapping variable names to values.
+    from .main import parse_arguments
+
+    if isinstance(row, list):
+        return parse_arguments([i.strip() for i in row])
+
+    values = json.loads(row)
+    if isinstance(values, list):
+        values = {f"_arg{n}": value for n, value in enumerate(values)}
+    if not isinstance(values, dict):
+        raise ValueError("Each line must be a JSON array or object")
+    for name, value in values.items():
+        if type(value) not in (int, bool):
+            raise ValueError(
+                f"Invalid value for '{name}'. Only booleans and integers may "
+                "be passed"
+            )
+    return values
+
+
+def run_row(program, row, index, max_steps=None, timeout=None):
+    from .main import execute
+
+    result = {"row": index}
+    try:
+        namespace = row_namespace(row)
+    except ValueError as e:
+        result["status"] = "invalid"
+        result["error"] = str(e)
+        return result
+
+    output = io.StringIO()
+    error = None
+    start = time.perf_counter_ns()
+    try:
+        with contextlib.redirect_stdout(output):
+            execute(program, namespace, max_steps, timeout)
+    except (WhileError, Exception) as e:
+        error = e
+    duration = time.perf_counter_ns() - start
+
+    _record(result, namespace, error, duration)
+    if output.getvalue():
+        result["output"] = output.getvalue()
+    return result
+
+
+def _record(result, namespace, error, duration):
+    if error is None or isinstance(error, WhileSystemExit):
+        result["status"] = "halted"
+    elif isinstance(error, WhileLimitError):
+        result["status"] = "timeout"
+        result["error"] = str(error)
+    else:
+        result["status"] = "error"
+        result["error"] = f"{type(error).__name__}: {error}"
+    result["duration_ns"] = duration
+
+    # Code values are written out as their source, as JSON has no way to
+    # hold them otherwise
+    result["namespace"] = {
+        name: value if type(value) in (int, bool) else str(value)
+        for name, value in namespace.items()
+        if not name.startswith("_")
+    }
+
+
+def run_vector(program, rows, max_steps=None, timeout=None):
+    # Runs every valid row at once. Rows share the time taken evenly, and a
+    # timeout applies to them all together rather than to each.
+    results = []
+    lanes = []
+    for index, row in rows:
+        result = {"row": index}
+        results.append(result)
+        try:
+            lanes.append((result, row_namespace(row)))
+        except ValueError as e:
+            result["status"] = "invalid"
+            result["error"] = str(e)
+
+    namespaces = [namespace for _, namespace in lanes]
+    start = time.perf_counter_ns()
+    errors = program(namespaces, max_steps, timeout)
+    duration = (time.perf_counter_ns() - start) // max(len(namespaces), 1)
+
+    for (result, namespace), error in zip(lanes, errors):
+        _record(result, namespace, error, duration)
+    return results
+
+
+def _initialise(ast, engine, vector=False):
+    from .main import ENGINES
+
+    global _program
+    _program = ENGINES[engine](ast)
+    if vector:
+        program = compile_vector(ast, _program)
+        # Programs that print or use directives need running a row at a
+        # time to keep their output apart
+        if program.vectorised:
+            _program = program
+
+
+def run_chunk(rows, max_steps, timeout):
+    if isinstance(_program, VectorProgram):
+        return run_vector(_program, rows, max_steps, timeout)
+    return [
+        run_row(_program, row, index, max_steps, timeout)
+        for index, row in rows
+    ]
+
+
+def run_batch(
+    ast, rows, engine="compile", max_steps=None, timeout=None, workers=1,
+    chunk_size=256, vector=False
+):
+    # Yields the result of running ast against each row, in order. With more
+    # than one worker, rows are sent out in chunks to a pool of processes
+    # which each compile the program once, and only a few chunks are kept
+    # in flight so that rows can be read, and results written, as they go.
+    # With vector, each chunk is run all at once as NumPy arrays.
+    rows = enumerate(rows)
+    if workers == 1:
+        _initialise(ast, engine, vector)
+        while chunk := list(itertools.islice(rows, chunk_size)):
+            yield from run_chunk(chunk, max_steps, timeout)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(
+        workers, initializer=_initialise, initargs=(ast, engine, vector)
+    ) as executor:
+        pending = collections.deque()
+        while chunk := list(itertools.islice(rows, chunk_size)):
+            pending.append(
+                executor.submit(run_chunk, chunk, max_steps, timeout)
+            )
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def read_rows(file_, format_):
+    if format_ == "csv":
+        for row in csv.reader(file_):
+            if row:
+                yield row
+    else:
+        for line in file_:
+            if line.strip():
+                yield line
+
+
+def main(argv=None):
+    from .main import ENGINES
+    from .optimise import Optimiser
+    from .diskcache import ASTCache
+    from .lexer import RegexLexer
+    from .parser import Parser
+
+    parser = argparse.ArgumentParser(
+        prog="while batch",
+        description=(
+            "Run a program once for each row of arguments in ROWS, writing "
+            "one JSON line per row with its final variables and how long "
+            "it took"
+        ),
+    )
+    parser.add_argument("source", help="Source code, or path to source file")
+    parser.add_argument(
+        "rows",
+        help=(
+            "CSV file of positional arguments, or JSON lines file of arrays "
+            "or objects. - reads from stdin"
+        ),
+    )
+    parser.add_argument(
+        "-c", "--code", action="store_true",
+        help="Interpret source as source, not a filename",
+    )
+    parser.add_argument(
+        "-f", "--format", choices=("csv", "jsonl"), default=None,
+        help="Format of ROWS. Defaults to csv for .csv files, else jsonl",
+    )
+    parser.add_argument(
+        "-o", "--output", default="-",
+        help="File to write results to, or - for stdout",
+    )
+    parser.add_argument(
+        "-j", "--workers", type=int, default=1,
+        help="Number of worker processes. 0 for one per CPU",
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=256,
+        help=(
+            "How many rows to send to a worker at once, or to run at once "
+            "with --vector"
+        ),
+    )
+    parser.add_argument(
+        "--vector", action="store_true",
+        help=(
+            "Run each chunk of rows at once using NumPy, if it's installed "
+            "and the program only does arithmetic and comparisons"
+        ),
+    )
+    parser.add_argument(
+        "-e", "--engine", choices=ENGINES, default="compile",
+    )
+    parser.add_argument(
+        "-O", dest="optimise", type=int, choices=Optimiser.LEVELS, default=0,
+        metavar="LEVEL",
+    )
+    parser.add_argument(
+        "--max-steps", type=int, default=None, metavar="STEPS",
+        help="Stop each row after this many loop iterations",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=None, metavar="SECONDS",
+        help="Stop each row after it has run for this long",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="Don't use the on-disk cache of parsed programs",
+    )
+    args = parser.parse_args(argv)
+
+    if args.code:
+        source = args.source
+    else:
+        try:
+            with open(args.source) as source_file:
+                source = source_file.read()
+        except FileNotFoundError:
+            print(f"while batch: {args.source}: No such file or directory",
+                  file=sys.stderr)
+            return
+
+    try:
+        if args.code or args.no_cache:
+            ast = Parser(RegexLexer(source)).program()
+        else:
+            ast = ASTCache.beside(args.source).parse(source)
+    except WhileError as e:
+        print(e, file=sys.stderr)
+        return
+    ast = Optimiser(args.optimise).optimise(ast)
+
+    if args.vector and not VectorProgram(ast, None).vectorised:
+        print("while batch: running rows one at a time, as NumPy isn't "
+              "installed or the program can't be vectorised", file=sys.stderr)
+
+    format_ = args.format
+    if format_ is None:
+        format_ = "csv" if args.rows.lower().endswith(".csv") else "jsonl"
+
+    counts = {}
+    with contextlib.ExitStack() as stack:
+        if args.rows == "-":
+            rows = sys.stdin
+        else:
+            rows = stack.enter_context(open(args.rows, newline=""))
+        if args.output == "-":
+            output = sys.stdout
+        else:
+            output = stack.enter_context(open(args.output, "w"))
+
+        for result in run_batch(
+            ast, read_rows(rows, format_), args.engine, args.max_steps,
+            args.timeout, args.workers, args.chunk_size, args.vector,
+        ):
+            output.write(json.dumps(result) + "\n")
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+
+    print(
+        ", ".join(f"{count} {status}" for status, count in counts.items()),
+        file=sys.stderr,
+    )
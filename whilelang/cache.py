@@ -0,0 +1,57 @@
+from collections import OrderedDict
+
+
+class LRUCache:
+    # A mapping holding at most `size` entries, evicting whichever was used
+    # least recently to make room. A size of 0 disables it.
+    def __init__(self, size=512):
+        self.size = size
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if self.size <= 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        self._evict()
+
+    def resize(self, size):
+        self.size = size
+        self._evict()
+
+    def _evict(self):
+        while len(self._entries) > max(self.size, 0):
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0
+
+    def __str__(self):
+        return (
+            f"{len(self)}/{self.size} entries, {self.hits} hits, "
+            f"{self.misses} misses ({self.hit_rate:.1%} hit rate), "
+            f"{self.evictions} evictions"
+        )
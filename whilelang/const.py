@@ -2,6 +2,7 @@ NUMBER, SYMBOL, NAME, KEYWORD, BOOLEAN, EOF, DIRECTIVE = (
     "NUMBER", "SYMBOL", "NAME", "KEYWORD", "BOOLEAN", "EOF", "DIRECTIVE"
 )
 ANY = None
+VERSION = "0.0.2"
 
 HELP_MESSAGE = """
 While directives list:
@@ -17,6 +18,10 @@ While directives list:
   @run_numeric [mode] [expr]: As with @from_numeric, except the resulting code
       is executed immediately.
   @eval [name]: Execute the contents of a variable as code
+  @cache: Output how effective the caches of Gödel numbers and the code they
+      decode to have been
+  @time: Output how long lexing, parsing, compiling and running the last
+      input took. Only available in the REPL, on a line of its own
 
-All directives can be used both in the REPL and in scripts.
+All other directives can be used both in the REPL and in scripts.
 """.strip()
@@ -0,0 +1,143 @@
+import hashlib
+import tempfile
+import pickle
+import sys
+import gc
+import os
+
+from .const import VERSION
+from .lexer import RegexLexer
+from .parser import Parser
+from .nodes import ASTNode
+
+
+class ASTCache:
+    # Parsed programs saved to disk, much like __pycache__, so that running
+    # the same large program again needn't lex and parse it from scratch.
+    # Entries are keyed by a hash of the source along with the interpreter
+    # and Python versions, and the least recently used are removed once the
+    # directory grows beyond max_size bytes.
+    DIRECTORY = "__whilecache__"
+    SUFFIX = ".ast"
+    MAGIC = b"WHILEAST"
+    # Bumped whenever the nodes change in a way that old pickles won't load
+    # into correctly
+    FORMAT = 1
+    MAX_SIZE = 64 * 1024 * 1024
+
+    def __init__(self, directory, max_size=MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+
+    @classmethod
+    def beside(cls, path, max_size=MAX_SIZE):
+        directory = os.path.dirname(os.path.abspath(path))
+        return cls(os.path.join(directory, cls.DIRECTORY), max_size)
+
+    def key(self, source):
+        digest = hashlib.sha256()
+        digest.update(
+            f"{VERSION} {self.FORMAT} {sys.version_info[:2]}\0".encode()
+        )
+        digest.update(source.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def load(self, source):
+        key = self.key(source)
+        path = self._path(key)
+        header = self.MAGIC + key.encode()
+
+        gc_enabled = gc.isenabled()
+        try:
+            with open(path, "rb") as file_:
+                if file_.read(len(header)) != header:
+                    raise ValueError("Cache entry header doesn't match")
+                # Unpickling allocates a node at a time, and the collector
+                # running over and over as it does dominates load time
+                gc.disable()
+                ast = pickle.load(file_)
+            if not isinstance(ast, ASTNode):
+                raise ValueError("Cache entry isn't a program")
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Truncated, corrupt, or written by an incompatible version
+            self._remove(path)
+            return None
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+        try:
+            # Keeps recently used entries from being cleaned up
+            os.utime(path)
+        except OSError:
+            pass
+        return ast
+
+    def store(self, source, ast):
+        try:
+            data = pickle.dumps(ast, pickle.HIGHEST_PROTOCOL)
+        except RecursionError:
+            # Too deeply nested to pickle, so will be parsed every time
+            return False
+        if len(data) > self.max_size:
+            return False
+        key = self.key(source)
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Written under a temporary name then moved into place, so a
+            # concurrent reader never sees half an entry
+            fd, temp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                # mkstemp only lets the owner read the file
+                os.chmod(temp, 0o644)
+                with os.fdopen(fd, "wb") as file_:
+                    file_.write(self.MAGIC + key.encode())
+                    file_.write(data)
+                os.replace(temp, self._path(key))
+            except BaseException:
+                self._remove(temp)
+                raise
+            self.cleanup()
+        except OSError:
+            # A cache we can't write to is no worse than no cache
+            return False
+        return True
+
+    def parse(self, source):
+        ast = self.load(source)
+        if ast is None:
+            ast = Parser(RegexLexer(source)).program()
+            self.store(source, ast)
+        return ast
+
+    def cleanup(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
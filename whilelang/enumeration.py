@@ -0,0 +1,137 @@
+from concurrent.futures import ProcessPoolExecutor
+import collections
+import contextlib
+import argparse
+import json
+import sys
+import io
+import os
+
+from .errors import WhileError, WhileStepLimitError
+from .limits import LimitedNamespace
+from .numeric import stmt_from_num
+
+
+def run_number(number, max_steps, engine="compile", optimise=0):
+    from .main import run
+
+    result = {"number": number}
+    try:
+        ast = stmt_from_num(number)
+    except (WhileError, IndexError) as e:
+        # Not every number decodes, as only x, y and z can be named
+        result["status"] = "invalid"
+        result["error"] = str(e)
+        return result
+
+    namespace = LimitedNamespace(max_steps=max_steps)
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            duration = run(ast, namespace, engine, optimise)
+    except WhileStepLimitError:
+        result["status"] = "timeout"
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+    else:
+        if duration == -1:
+            result["status"] = "error"
+            result["error"] = output.getvalue().strip()
+        else:
+            result["status"] = "halted"
+    result["steps"] = namespace.steps
+    result["namespace"] = dict(namespace)
+    return result
+
+
+def run_chunk(start, end, max_steps, engine, optimise):
+    return [
+        run_number(number, max_steps, engine, optimise)
+        for number in range(start, end)
+    ]
+
+
+def enumerate_programs(
+    start, end, max_steps=10000, engine="compile", optimise=0,
+    workers=None, chunk_size=256
+):
+    # Yields the result of running every program numbered from start up to,
+    # but not including, end, in order. Numbers are handed out to workers in
+    # chunks so that each only has to report back once per chunk, and only a
+    # few chunks are kept in flight so that results are written as they go.
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as executor:
+        pending = collections.deque()
+        for i in range(start, end, chunk_size):
+            pending.append(executor.submit(
+                run_chunk, i, min(i + chunk_size, end), max_steps, engine,
+                optimise,
+            ))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def main(argv=None):
+    from .main import ENGINES
+    from .optimise import Optimiser
+
+    parser = argparse.ArgumentParser(
+        prog="while enumerate",
+        description=(
+            "Decode and run every program whose Gödel number is at least "
+            "START and less than END, writing one JSON line per program"
+        ),
+    )
+    parser.add_argument("start", type=int)
+    parser.add_argument("end", type=int)
+    parser.add_argument(
+        "-s", "--steps", type=int, default=10000,
+        help="Loop iterations each program may run before it is stopped",
+    )
+    parser.add_argument(
+        "-j", "--workers", type=int, default=None,
+        help="Number of worker processes. Defaults to one per CPU",
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=256,
+        help="How many programs to send to a worker at once",
+    )
+    parser.add_argument(
+        "-o", "--output", default="-",
+        help="File to write results to, or - for stdout",
+    )
+    parser.add_argument(
+        "-e", "--engine", choices=ENGINES, default="compile",
+    )
+    parser.add_argument(
+        "-O", dest="optimise", type=int, choices=Optimiser.LEVELS, default=0,
+        metavar="LEVEL",
+    )
+    args = parser.parse_args(argv)
+
+    if args.end <= args.start or args.start < 0:
+        print("while enumerate: END must be greater than START, and START "
+              "may not be negative", file=sys.stderr)
+        return
+
+    counts = {}
+    with contextlib.ExitStack() as stack:
+        if args.output == "-":
+            output = sys.stdout
+        else:
+            output = stack.enter_context(open(args.output, "w"))
+
+        for result in enumerate_programs(
+            args.start, args.end, args.steps, args.engine, args.optimise,
+            args.workers, args.chunk_size,
+        ):
+            output.write(json.dumps(result) + "\n")
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+
+    print(
+        ", ".join(f"{count} {status}" for status, count in counts.items()),
+        file=sys.stderr,
+    )
@@ -3,8 +3,29 @@ class WhileError(BaseException):
 
 
 class WhileSyntaxError(WhileError):
-    pass
+    def __init__(self, message, location=None):
+        super().__init__(message)
+        self.location = location
 
 
 class WhileSystemExit(WhileError):
     pass
+
+
+class WhileLimitError(WhileError):
+    def __init__(self, message, namespace=None):
+        super().__init__(message)
+        # The namespace as it was when the limit was hit
+        self.namespace = namespace
+
+
+class WhileStepLimitError(WhileLimitError):
+    pass
+
+
+class WhileTimeoutError(WhileLimitError):
+    pass
+
+
+class WhileCancelledError(WhileLimitError):
+    pass
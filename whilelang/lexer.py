@@ -1,8 +1,10 @@
 import string
+import re
 
 from .token import Token
 from .const import DIRECTIVE, NUMBER, SYMBOL, NAME, KEYWORD, BOOLEAN, EOF
 from .errors import WhileSyntaxError
+from .source import Source, StreamSource
 
 
 class Lexer:
@@ -20,20 +22,30 @@ class Lexer:
     DOUBLE_SYMBOLS = ("<=", ">=", ":=")
     SYMBOLS = (">", "<", "=", "+", "-", "*", "|", "&", "¬", "!", "(", ")", ";")
 
-    def __init__(self, text: str):
-        self._text = text
+    def __init__(self, text, recover=False):
+        if not isinstance(text, Source):
+            text = Source(text)
+        self.source = text
+        self._text = text.text
         self._cursor = 0
         self._position = (0, 0)
         self._cur_char = None
+        # When recovering, errors are collected here and the offending
+        # character skipped, rather than raising on the first one
+        self._recover = recover
+        self.errors = []
 
         self._advance()
 
     def _error(self, message):
         error = f"FATAL: Syntax error on line {self._position[0] + 1}\n"
         error += "  " + message + "\n"
-        error += self._text.split("\n")[self._position[0]] + "\n"
+        error += self.source.line(self._position[0]) + "\n"
         error += " " * self._position[1] + "^"
-        raise WhileSyntaxError(error)
+        error = WhileSyntaxError(error, self._position)
+        if not self._recover:
+            raise error
+        self.errors.append(error)
 
     def _advance(self):
         y, x = self._position
@@ -121,6 +133,7 @@ class Lexer:
                 return self._consume_number()
 
             self._error(f"Unexpected character '{self._cur_char}'")
+            self._advance()
         return Token(EOF, None, self._position, 0)
 
     def __iter__(self):
@@ -128,3 +141,166 @@ class Lexer:
         while (token := next(self)).type != EOF:
             yield token
         yield token
+
+
+class RegexLexer(Lexer):
+    # Produces exactly the same tokens as Lexer, but matches whole tokens at
+    # a time with a single compiled regex rather than character by character
+    # Each match is a token along with any whitespace preceding it
+    TOKEN_RE = re.compile(r"""
+        [ \n\r\t]*
+        (?:
+            (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+          | (?P<symbol><=|>=|:=|[><=+\-*|&¬!();])
+          | (?P<number>[0-9]+)
+          | (?P<comment>//[^\n]*\n?)
+          | @(?P<directive>[A-Za-z0-9_]*)
+          | (?P<eof>\Z)
+          | (?P<error>.)
+        )
+    """, re.VERBOSE | re.DOTALL)
+
+    WORDS = {
+        **{i: (KEYWORD, i) for i in Lexer.KEYWORDS},
+        "true": (BOOLEAN, True),
+        "false": (BOOLEAN, False),
+    }
+
+    def __init__(self, text, recover=False):
+        if not isinstance(text, Source):
+            text = Source(text)
+        self.source = text
+        self._text = text.text
+        self._recover = recover
+        self.errors = []
+        self._tokens = self._generate()
+
+    def _chunks(self):
+        # The text to lex, a piece at a time
+        yield self._text
+
+    def _generate(self):
+        words = self.WORDS
+        chunks = self._chunks()
+        text = ""
+        # Offset of the start of text from the start of the source, and how
+        # far into text has been lexed. Everything else counts from the
+        # start of the source.
+        base = 0
+        pos = 0
+        final = False
+        line = 0
+        # Lexer counts columns from 1 on the first line, and from 0 after
+        # that, so we pretend the first line starts before the text does
+        line_start = -1
+
+        while True:
+            chunk = next(chunks, None)
+            if chunk is None:
+                final = True
+            else:
+                base += pos
+                text = text[pos:] + chunk
+                pos = 0
+            length = len(text)
+
+            for match in self.TOKEN_RE.finditer(text, pos):
+                end = match.end()
+                # A token running up to the end of the text read so far may
+                # carry on into the next chunk, so is lexed again once it
+                # has been read
+                if end == length and not final:
+                    break
+                kind = match.lastgroup
+                start = match.start(kind)
+                pos = end
+
+                if "\n" in text[match.start():start]:
+                    line += text.count("\n", match.start(), start)
+                    line_start = (
+                        base + text.rfind("\n", match.start(), start) + 1
+                    )
+
+                if kind == "name":
+                    word = match[kind]
+                    type_, meta = words.get(word, (NAME, word))
+                    yield Token(
+                        type_, meta, (line, base + end - line_start),
+                        end - start
+                    )
+                elif kind == "symbol":
+                    yield Token(
+                        SYMBOL, match[kind], (line, base + end - line_start),
+                        end - start
+                    )
+                elif kind == "number":
+                    yield Token(
+                        NUMBER, int(match[kind]),
+                        (line, base + end - line_start), end - start
+                    )
+                elif kind == "comment":
+                    if text[end - 1] == "\n":
+                        line += 1
+                        line_start = base + end
+                    elif end == length:
+                        # Lexer steps once past the end of the text when a
+                        # comment isn't terminated by a newline
+                        line_start -= 1
+                elif kind == "directive":
+                    # The match includes the @
+                    start -= 1
+                    yield Token(
+                        DIRECTIVE, match[kind],
+                        (line, base + end - line_start), end - start
+                    )
+                elif kind == "eof":
+                    break
+                else:
+                    self._position = (line, base + start - line_start)
+                    self._error(f"Unexpected character '{text[start]}'")
+            if final:
+                break
+
+        while True:
+            yield Token(EOF, None, (line, base + length - line_start), 0)
+
+    def __next__(self):
+        return next(self._tokens)
+
+    def __iter__(self):
+        for token in self._tokens:
+            yield token
+            if token.type == EOF:
+                break
+
+
+class StreamLexer(RegexLexer):
+    # Lexes a file as it's read, a chunk at a time, so that very large
+    # programs needn't be read into memory in full before they're parsed
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, file_, recover=False, chunk_size=CHUNK_SIZE):
+        self._file = file_
+        self._chunk_size = chunk_size
+        self.source = StreamSource(getattr(file_, "name", None))
+        self._recover = recover
+        self.errors = []
+        self._tokens = self._generate()
+
+    def _chunks(self):
+        while chunk := self._file.read(self._chunk_size):
+            yield chunk
+
+
+class Replay:
+    # Hands tokens that have already been lexed to the parser, so that
+    # lexing and parsing can be timed separately
+    def __init__(self, source, tokens):
+        if not isinstance(source, Source):
+            source = Source(source)
+        self.source = source
+        self._tokens = iter(tokens)
+        self._eof = tokens[-1]
+
+    def __next__(self):
+        return next(self._tokens, self._eof)
@@ -0,0 +1,49 @@
+import time
+
+from .errors import WhileStepLimitError, WhileTimeoutError
+
+
+class LimitedNamespace(dict):
+    # A namespace which counts the iterations of every loop run against it,
+    # raising once there have been more than max_steps, or once timeout
+    # seconds have passed since it was created. Engines call tick() on loop
+    # back-edges when the namespace has one, so running against a plain dict
+    # costs nothing extra.
+    # Reading the clock costs more than a loop iteration, so it's only read
+    # every CLOCK_INTERVAL steps
+    CLOCK_INTERVAL = 1024
+
+    def __init__(self, values=(), max_steps=None, timeout=None):
+        super().__init__(values)
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.steps = 0
+
+        self._deadline = None
+        if timeout is not None:
+            self._deadline = time.monotonic() + timeout
+        # The step count at which either limit next needs checking
+        self._next_check = 0
+
+    def tick(self, count=1):
+        self.steps += count
+        if self.steps >= self._next_check:
+            self._next_check = self._check()
+
+    def _check(self):
+        # Raises if a limit has been passed, otherwise returns the step count
+        # at which to check again
+        next_check = float("inf")
+        if self.max_steps is not None:
+            if self.steps > self.max_steps:
+                raise WhileStepLimitError(
+                    f"Step limit of {self.max_steps} exceeded", self
+                )
+            next_check = self.max_steps + 1
+        if self._deadline is not None:
+            if time.monotonic() > self._deadline:
+                raise WhileTimeoutError(
+                    f"Timed out after {self.timeout}s", self
+                )
+            next_check = min(next_check, self.steps + self.CLOCK_INTERVAL)
+        return next_check
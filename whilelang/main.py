@@ -2,30 +2,164 @@ import traceback
 import argparse
 import time
 import sys
+import io
 
-from .lexer import Lexer
+from .lexer import RegexLexer, StreamLexer, Replay
 from .parser import Parser
-from .errors import WhileSystemExit, WhileError
+from .optimise import Optimiser
+from .numeric import set_cache_size
+from .cache import LRUCache
+from .const import KEYWORD
+from . import enumeration, batch
+from .transpile import compile_python
+from .vm import compile_vm
+from .slots import compile_slots
+from .nodes import ASTNode
+from .limits import LimitedNamespace
+from .profiler import Profiler
+from .diskcache import ASTCache
+from .errors import (
+    WhileSystemExit, WhileError, WhileLimitError, WhileSyntaxError
+)
 
+# How many inputs the REPL keeps the compiled form of
+REPL_CACHE_SIZE = 128
 
-def run(code, initial=None):
+ENGINES = {
+    "compile": lambda ast: ast.compile(),
+    "walk": lambda ast: ast.visit,
+    "python": compile_python,
+    "vm": compile_vm,
+    "slots": compile_slots,
+}
+
+
+def execute(program, namespace, max_steps=None, timeout=None):
+    if max_steps is None and timeout is None:
+        return program(namespace)
+
+    limited = LimitedNamespace(namespace, max_steps, timeout)
+    try:
+        return program(limited)
+    finally:
+        # Leave the namespace as the program left it, even if it was stopped
+        namespace.clear()
+        namespace.update(limited)
+
+
+def streamed(parser, compile_):
+    # Each top-level statement is compiled and run as soon as it has been
+    # parsed, then dropped, so only one is ever held in memory
+    def program(namespace):
+        ret = 0
+        for statement in parser.statements():
+            ret = compile_(statement)(namespace)
+        return ret
+    return program
+
+
+def run(
+    code, initial=None, engine="compile", optimise=0, max_steps=None,
+    timeout=None, profiler=None
+):
     namespace = initial
     if namespace is None:
         namespace = {}
 
+    # Callers wanting to know how much was optimised away can pass their
+    # own Optimiser rather than a level
+    optimiser = optimise
+    if not isinstance(optimiser, Optimiser):
+        optimiser = Optimiser(optimise)
+
+    def compile_(ast):
+        ast = optimiser.optimise(ast)
+        if profiler is not None:
+            ast = profiler.instrument(ast)
+        return ENGINES[engine](ast)
+
     try:
-        parser = Parser(Lexer(code))
+        if isinstance(code, io.TextIOBase):
+            # Files are run as they're read, a statement at a time
+            start = time.time_ns()
+            program = streamed(Parser(StreamLexer(code)), compile_)
+        else:
+            # Programs can also be given already parsed
+            if isinstance(code, ASTNode):
+                ast = code
+            else:
+                ast = Parser(RegexLexer(code)).program()
 
-        start = time.time_ns()
-        parser.program().visit(namespace)
+            start = time.time_ns()
+            program = compile_(ast)
+        execute(program, namespace, max_steps, timeout)
     except WhileSystemExit:
         pass
+    except WhileLimitError:
+        # Left to the caller, which may want to look at where it got to
+        raise
     except WhileError as e:
         print(e)
         return -1
     return time.time_ns() - start
 
 
+def parse_arguments(arguments):
+    namespace = {}
+    for n, i in enumerate(arguments):
+        if i == "true":
+            i = True
+        elif i == "false":
+            i = False
+        elif i.isdigit():
+            i = int(i)
+        else:
+            raise ValueError(f"Invalid argument '{i}'")
+        namespace[f"_arg{n}"] = i
+    return namespace
+
+
+def check(code):
+    parser = Parser(RegexLexer(code, recover=True), recover=True)
+    parser.program()
+    for error in parser.errors:
+        print(error)
+    return len(parser.errors)
+
+
+def incomplete(code):
+    # Whether code stops part way through a statement, so the REPL should
+    # read another line of it before running it. A suite may be empty, so
+    # a trailing then, else or do parses, but is almost never what's meant.
+    # Tokens are located by where they end, so without the newline a
+    # syntax error in the last token would look to be at the end
+    code += "\n"
+    try:
+        tokens = list(RegexLexer(code))
+    except WhileError:
+        return False
+    if len(tokens) > 1 and tokens[-2].type == KEYWORD and (
+        tokens[-2].meta in ("then", "else", "do")
+    ):
+        return True
+    try:
+        Parser(Replay(code, tokens)).program()
+    except WhileSyntaxError as e:
+        return e.location == tokens[-1].location
+    return False
+
+
+def print_timings(timings, cached):
+    if timings is None:
+        print("Nothing has been run yet")
+        return
+    for phase, duration in timings.items():
+        if cached and phase != "execute":
+            print(f"  {phase:<8} (cached)")
+        else:
+            print(f"  {phase:<8} {duration / 1000000:.3f}ms")
+
+
 def repl(args):
     print(
         "While interpreter running on Python "
@@ -34,23 +168,73 @@ def repl(args):
     print("Type @help for basic help, @reset to reset the repl, "
           "and @exit to exit")
     namespace = {}
+    # What each recent input compiled to, so that entering it again goes
+    # straight to running it
+    compiled = LRUCache(REPL_CACHE_SIZE)
+    # How long each phase of the last input took, for @time, and whether
+    # it was compiled or found already in the cache
+    timings = None
+    cached = False
     while True:
         try:
             code = input(">>> ")
+            entry = compiled.get(code)
+            # Keep reading lines until they make up whole statements, or
+            # until an empty line gives up and reports the error
+            while (
+                entry is None and code.strip() != "@time"
+                and incomplete(code)
+            ):
+                line = input("... ")
+                if not line.strip():
+                    break
+                code += "\n" + line
+                entry = compiled.get(code)
         except KeyboardInterrupt:
             print()
             continue
         if not code.strip():
             continue
+        if code.strip() == "@time":
+            print_timings(timings, cached)
+            continue
 
         try:
-            ast = Parser(Lexer(code)).program()
+            cached = entry is not None
+            if entry is None:
+                timings = {}
+                start = time.perf_counter_ns()
+                tokens = list(RegexLexer(code))
+                timings["lex"] = time.perf_counter_ns() - start
 
-            if args.numeric:
-                print(ast.numeric())
+                start = time.perf_counter_ns()
+                ast = Parser(Replay(code, tokens)).program()
+                timings["parse"] = time.perf_counter_ns() - start
+
+                start = time.perf_counter_ns()
+                if args.numeric:
+                    program = None
+                else:
+                    ast = Optimiser(args.optimise).optimise(ast)
+                    program = ENGINES[args.engine](ast)
+                timings["compile"] = time.perf_counter_ns() - start
+                compiled.put(code, (ast, program))
             else:
-                if (ret := ast.visit(namespace)) is not None:
-                    print(ret)
+                ast, program = entry
+                timings = dict.fromkeys(("lex", "parse", "compile"), 0)
+
+            start = time.perf_counter_ns()
+            try:
+                if args.numeric:
+                    print(ast.numeric())
+                else:
+                    ret = execute(
+                        program, namespace, args.max_steps, args.timeout
+                    )
+                    if ret is not None:
+                        print(ret)
+            finally:
+                timings["execute"] = time.perf_counter_ns() - start
         except WhileSystemExit:
             break
         except WhileError as e:
@@ -60,6 +244,18 @@ def repl(args):
 
 
 def main():
+    # Gödel numbers quickly run to more digits than Python will convert
+    # to or from strings by default
+    if hasattr(sys, "set_int_max_str_digits"):
+        sys.set_int_max_str_digits(0)
+
+    if sys.argv[1:2] == ["enumerate"]:
+        enumeration.main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["batch"]:
+        batch.main(sys.argv[2:])
+        return
+
     parser = argparse.ArgumentParser(prog="while")
     parser.add_argument(
         "source", default=None, nargs="?",
@@ -73,66 +269,150 @@ def main():
         "-n", "--numeric", action="store_true",
         help="Calculate the Godel number rather than evaluating",
     )
+    parser.add_argument(
+        "--check", action="store_true",
+        help="Report every syntax error in the source without running it",
+    )
+    parser.add_argument(
+        "-e", "--engine", choices=ENGINES, default="compile",
+        help=(
+            "Execution engine to use. 'walk' interprets the tree directly, "
+            "'python' translates the program to Python source, 'vm' runs "
+            "it on a register-based bytecode VM, 'slots' compiles it with "
+            "each variable resolved to an index of a list"
+        ),
+    )
+    parser.add_argument(
+        "-O", dest="optimise", type=int, choices=Optimiser.LEVELS, default=0,
+        metavar="LEVEL",
+        help="Optimisation level (0, 1 or 2) to apply before execution",
+    )
+    parser.add_argument(
+        "--max-steps", type=int, default=None, metavar="STEPS",
+        help="Stop the program after this many loop iterations",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=None, metavar="SECONDS",
+        help="Stop the program after it has run for this long",
+    )
+    parser.add_argument(
+        "--profile", action="store_true",
+        help=(
+            "Count and time every statement executed, and print the "
+            "slowest afterwards"
+        ),
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help=(
+            f"Don't save parsed programs to, or load them from, "
+            f"{ASTCache.DIRECTORY}"
+        ),
+    )
+    parser.add_argument(
+        "--stream", action="store_true",
+        help=(
+            "Run a source file a statement at a time as it's read, rather "
+            "than reading and parsing all of it first"
+        ),
+    )
+    parser.add_argument(
+        "--numeric-cache", type=int, default=None, metavar="SIZE",
+        help=(
+            "How many Gödel numbers, and the code they decode to, to cache. "
+            "0 disables caching"
+        ),
+    )
     parser.add_argument(
         "arguments", nargs="*",
         help="Arguments to pass to the program",
     )
     args = parser.parse_args()
 
-    namespace = {}
-    for n, i in enumerate(args.arguments):
-        if i == "true":
-            i = True
-        elif i == "false":
-            i = False
-        elif i.isdigit():
-            i = int(i)
-        else:
-            print(f"Invalid argument '{i}'")
-            print("Only booleans and integers may be passed this way.")
-            return
-        namespace[f"_arg{n}"] = i
+    if args.numeric_cache is not None:
+        set_cache_size(args.numeric_cache)
+
+    try:
+        namespace = parse_arguments(args.arguments)
+    except ValueError as e:
+        print(e)
+        print("Only booleans and integers may be passed this way.")
+        return
 
     if not args.source:
         repl(args)
         return
 
+    if args.stream and args.code:
+        print("while: --stream can only be used with a source file")
+        return
+    # Checking and numbering need the whole program at once
+    stream = args.stream and not (args.check or args.numeric)
+
     if not args.code:
         try:
-            with open(args.source) as source_file:
-                source = source_file.read()
+            source_file = open(args.source)
         except FileNotFoundError:
             print(f"while: {args.code}: No such file or directory")
             return
+        if stream:
+            source = source_file
+        else:
+            with source_file:
+                source = source_file.read()
     else:
         source = args.source
 
+    if args.check:
+        check(source)
+        return
+
     if args.numeric:
         try:
-            num = Parser(Lexer(source)).suite().numeric()
+            num = Parser(RegexLexer(source)).suite().numeric()
         except WhileError as e:
             print(e)
         else:
             print(num)
         return
 
-    namespace = {}
-    for n, i in enumerate(sys.argv[2:]):
-        if i == "true":
-            i = True
-        elif i == "false":
-            i = False
-        elif i.isdigit():
-            i = int(i)
-        else:
-            print(f"Invalid argument '{i}'")
-            print("Only booleans and integers may be passed this way.")
+    code = source
+    if not args.code and not args.no_cache and not stream:
+        try:
+            code = ASTCache.beside(args.source).parse(source)
+        except WhileError as e:
+            print(e)
             return
-        namespace[f"_arg{n}"] = i
 
-    duration_ns = run(source, namespace)
-    print(f"Completed in {duration_ns / 1000000}ms")
+    profiler = None
+    if args.profile:
+        if args.engine not in Profiler.ENGINES:
+            print(f"while: --profile can't be used with the {args.engine} "
+                  "engine")
+            return
+        profiler = Profiler()
+
+    optimiser = Optimiser(args.optimise)
+    try:
+        duration_ns = run(
+            code, namespace, args.engine, optimiser, args.max_steps,
+            args.timeout, profiler,
+        )
+    except WhileLimitError as e:
+        # Show how far the program got before it was stopped
+        print(e)
+    else:
+        if args.optimise and duration_ns != -1:
+            print(f"Optimiser removed {optimiser.removed} nodes")
+        print(f"Completed in {duration_ns / 1000000}ms")
+    finally:
+        if stream:
+            source.close()
     for i in namespace:
         if i.startswith("_"):
             continue
-        print(f"{i} := {namespace[i]}")
\ No newline at end of file
+        print(f"{i} := {namespace[i]}")
+
+    if profiler is not None:
+        print()
+        print(profiler.report())
\ No newline at end of file
@@ -1,29 +1,102 @@
+import operator
+
+from .cache import LRUCache
 from .const import HELP_MESSAGE
 from .errors import WhileError, WhileSystemExit
-from .util import phi, beta, numeric_name
-from .numeric import bool_from_num, arith_from_num, stmt_from_num
+from .numeric import (
+    bool_from_num, arith_from_num, stmt_from_num, num_from_node,
+    ENCODE_CACHE, DECODE_CACHE, CODE_CACHE
+)
+
+# The slots of each node class, in the order they're declared
+_FIELDS = {}
 
 
 class ASTNode:
+    __slots__ = ()
+
     def __init__(self):
         pass
 
     def visit(self, *args):
         pass
 
+    def children(self):
+        return ()
+
+    def compile(self):
+        # Nodes without a specialised form fall back to the tree-walker
+        return self.visit
+
     def numeric(self):
-        raise WhileError(
-            f"Node {self.__class__.__name__} does not implement numeric()"
-        )
+        return num_from_node(self)
 
     def __str__(self):
         return ""
 
+    def _fields(self):
+        # Everything the node is made of, including where it came from
+        cls = type(self)
+        fields = _FIELDS.get(cls)
+        if fields is None:
+            fields = _FIELDS[cls] = tuple(
+                name for base in reversed(cls.__mro__)
+                for name in base.__dict__.get("__slots__", ())
+            )
+        return [getattr(self, name) for name in fields]
+
+    def __eq__(self, other):
+        # Structural, over an explicit stack so that trees of any depth can
+        # be compared. Values must be of the same type too, as true and 1
+        # compare equal but are different programs.
+        if not isinstance(other, ASTNode):
+            return NotImplemented
+        stack = [(self, other)]
+        while stack:
+            lhs, rhs = stack.pop()
+            if lhs is rhs:
+                continue
+            if type(lhs) is not type(rhs):
+                return False
+            if isinstance(lhs, ASTNode):
+                stack.extend(zip(lhs._fields(), rhs._fields()))
+            elif isinstance(lhs, (list, tuple)):
+                if len(lhs) != len(rhs):
+                    return False
+                stack.extend(zip(lhs, rhs))
+            elif lhs != rhs:
+                return False
+        return True
+
+    def __hash__(self):
+        parts = []
+        stack = [self]
+        while stack:
+            value = stack.pop()
+            parts.append(type(value))
+            if isinstance(value, ASTNode):
+                stack.extend(value._fields())
+            elif isinstance(value, (list, tuple)):
+                stack.extend(value)
+            else:
+                try:
+                    parts.append(hash(value))
+                except TypeError:
+                    # Such as the mappings of induction loops, which are
+                    # derived from the rest of the loop anyway
+                    pass
+        return hash(tuple(parts))
+
 
 class SuiteNode(ASTNode):
+    __slots__ = ("statements", )
+
     def __init__(self, statements):
         self.statements = statements
 
+    def children(self):
+        return tuple(self.statements)
+
     def __str__(self):
         return "; ".join(map(str, self.statements))
 
@@ -33,25 +106,43 @@ class SuiteNode(ASTNode):
             ret = i.visit(*args)
         return ret
 
-    def numeric(self):
-        if len(self.statements) == 0:
-            return 0
-        if len(self.statements) == 1:
-            return self.statements[0].numeric()
+    def compile(self):
+        statements = [i.compile() for i in self.statements]
+        if len(statements) == 0:
+            return lambda namespace: 0
+        if len(statements) == 1:
+            return statements[0]
+        if len(statements) == 2:
+            first, last = statements
+
+            def suite(namespace):
+                first(namespace)
+                return last(namespace)
+            return suite
 
-        val = phi(self.statements[-2].numeric(), self.statements[-1].numeric())
-        val = 3 + 4 * val
+        *body, last = statements
 
-        for i in self.statements[-3::-1]:
-            val = 3 + 4 * phi(i.numeric(), val)
-        return val
+        def suite(namespace):
+            for i in body:
+                i(namespace)
+            return last(namespace)
+        return suite
 
 
 class IfNode(ASTNode):
-    def __init__(self, condition, body, else_body):
+    __slots__ = ("condition", "body", "else_body", "location")
+
+    def __init__(self, condition, body, else_body, location=None):
         self.condition = condition
         self.body = body
         self.else_body = else_body
+        # Where the statement's first token was, if it came from source
+        self.location = location
+
+    def children(self):
+        if self.else_body is None:
+            return (self.condition, self.body)
+        return (self.condition, self.body, self.else_body)
 
     def __str__(self):
         if self.else_body is None:
@@ -66,44 +157,165 @@ class IfNode(ASTNode):
         elif self.else_body is not None:
             self.else_body.visit(*args)
 
-    def numeric(self):
-        else_body = (
-            self.else_body.numeric() if self.else_body is not None else 0
-        )
-        return 4 + 4 * phi(
-            self.condition.numeric(),
-            phi(self.body.numeric(), else_body)
-        )
+    def compile(self):
+        condition = self.condition.compile()
+        body = self.body.compile()
+        if self.else_body is None:
+            def if_(namespace):
+                if condition(namespace):
+                    body(namespace)
+            return if_
+
+        else_body = self.else_body.compile()
+
+        def if_else(namespace):
+            if condition(namespace):
+                body(namespace)
+            else:
+                else_body(namespace)
+        return if_else
 
 
 class WhileNode(ASTNode):
-    def __init__(self, condition, body):
+    __slots__ = ("condition", "body", "location")
+
+    def __init__(self, condition, body, location=None):
         self.condition = condition
         self.body = body
+        self.location = location
+
+    def children(self):
+        return (self.condition, self.body)
 
     def __str__(self):
         return f"while ({self.condition}) do ({self.body})"
 
-    def visit(self, *args):
-        while self.condition.visit(*args):
-            self.body.visit(*args)
+    def visit(self, namespace, *args):
+        tick = getattr(namespace, "tick", None)
+        while self.condition.visit(namespace, *args):
+            self.body.visit(namespace, *args)
+            if tick is not None:
+                tick()
+
+    def compile(self):
+        condition = self.condition.compile()
+        body = self.body.compile()
+
+        def while_(namespace):
+            tick = getattr(namespace, "tick", None)
+            while condition(namespace):
+                body(namespace)
+                if tick is not None:
+                    tick()
+        return while_
+
+
+def _linear(form, values):
+    return sum(
+        coeff * (1 if name is None else values[name])
+        for name, coeff in form.items()
+    )
+
+
+class InductionLoopNode(WhileNode):
+    # A while loop whose body only steps variables by loop-invariant amounts,
+    # and whose condition compares linear combinations of variables. These
+    # are built by the optimiser, and run in constant time by computing the
+    # trip count up front.
+    __slots__ = ("mode", "delta", "steps")
+
+    def __init__(self, condition, body, mode, delta, steps, location=None):
+        super().__init__(condition, body, location)
+        # The condition is `delta <mode> 0`, with delta and each step as a
+        # mapping of variable name (None for the constant term) to its
+        # coefficient
+        self.mode = mode
+        self.delta = delta
+        self.steps = steps
+
+    def _trips(self, start, step):
+        # Number of times the body would execute given the initial value of
+        # delta and how much it changes by each iteration, or None if forever
+        if self.mode == "=":
+            if start != 0:
+                return 0
+            return None if step == 0 else 1
+
+        # Normalise the condition to `start + n * step > 0`
+        if self.mode == ">=":
+            start += 1
+        elif self.mode == "<":
+            start, step = -start, -step
+        elif self.mode == "<=":
+            start, step = 1 - start, -step
 
-    def numeric(self):
-        return 1 + 4 * phi(self.condition.numeric(), self.body.numeric())
+        if start <= 0:
+            return 0
+        if step >= 0:
+            return None
+        return (start - step - 1) // -step
+
+    def _accelerate(self, namespace):
+        names = set(self.delta) | {name for name, _ in self.steps}
+        for _, step in self.steps:
+            names |= set(step)
+        names.discard(None)
+
+        values = {}
+        for name in names:
+            values[name] = namespace.get(name, 0)
+            if not isinstance(values[name], int):
+                return False
+
+        steps = [
+            (name, _linear(step, values)) for name, step in self.steps
+        ]
+        trips = self._trips(
+            _linear(self.delta, values),
+            sum(self.delta.get(name, 0) * step for name, step in steps),
+        )
+        if trips is None:
+            return False
+
+        if trips:
+            # Counts against any step limit as if each iteration had run
+            tick = getattr(namespace, "tick", None)
+            if tick is not None:
+                tick(trips)
+            for name, step in steps:
+                namespace[name] = values[name] + trips * step
+        return True
+
+    def visit(self, namespace, *args):
+        if not self._accelerate(namespace):
+            super().visit(namespace, *args)
+
+    def compile(self):
+        loop = super().compile()
+
+        def induction_loop(namespace):
+            if not self._accelerate(namespace):
+                loop(namespace)
+        return induction_loop
 
 
 class SkipNode(ASTNode):
+    __slots__ = ()
+
     def __str__(self):
         return "skip"
 
-    def numeric(self):
-        return 0
-
 
 class AssignNode(ASTNode):
-    def __init__(self, name, value):
+    __slots__ = ("name", "value", "location")
+
+    def __init__(self, name, value, location=None):
         self.name = name
         self.value = value
+        self.location = location
+
+    def children(self):
+        return (self.value, )
 
     def __str__(self):
         return f"{self.name} := {self.value}"
@@ -111,11 +323,18 @@ class AssignNode(ASTNode):
     def visit(self, namespace, *args):
         namespace[self.name] = self.value.visit(namespace, *args)
 
-    def numeric(self):
-        return 2 + 4 * phi(numeric_name(self.name), self.value.numeric())
+    def compile(self):
+        name = self.name
+        value = self.value.compile()
+
+        def assign(namespace):
+            namespace[name] = value(namespace)
+        return assign
 
 
 class ConstantNode(ASTNode):
+    __slots__ = ("value", )
+
     def __init__(self, value):
         self.value = value
 
@@ -125,35 +344,64 @@ class ConstantNode(ASTNode):
     def visit(self, *args):
         return self.value
 
-    def numeric(self):
-        if isinstance(self.value, float):
-            raise NotImplementedError("Floats disallowed in canonical while")
-        if isinstance(self.value, bool):
-            return 1 - self.value
-        return 5 * beta(self.value)
+    def compile(self):
+        value = self.value
+        return lambda namespace: value
 
 
 class NotNode(ASTNode):
+    __slots__ = ("expr", )
+
     def __init__(self, expr):
         self.expr = expr
 
+    def children(self):
+        return (self.expr, )
+
     def __str__(self):
         return f"¬{self.expr}"
 
     def visit(self, *args):
         return not self.expr.visit(*args)
 
-    def numeric(self):
-        return 4 + 4 * self.expr.numeric()
+    def compile(self):
+        expr = self.expr.compile()
+        return lambda namespace: not expr(namespace)
 
 
 class _BinNode(ASTNode):
+    __slots__ = ("lhs", "rhs")
     op = ""
+    function = None
 
     def __init__(self, lhs, rhs):
         self.lhs = lhs
         self.rhs = rhs
 
+    def children(self):
+        return (self.lhs, self.rhs)
+
+    def compile(self):
+        op = self.function
+        lhs, rhs = self.lhs, self.rhs
+
+        # Specialise the common variable/constant operand pairs so the hot
+        # path skips a closure call per operand
+        if isinstance(lhs, VariableNode) and isinstance(rhs, ConstantNode):
+            name, value = lhs.name, rhs.value
+            return lambda namespace: op(namespace.get(name, 0), value)
+        if isinstance(lhs, ConstantNode) and isinstance(rhs, VariableNode):
+            value, name = lhs.value, rhs.name
+            return lambda namespace: op(value, namespace.get(name, 0))
+        if isinstance(lhs, VariableNode) and isinstance(rhs, VariableNode):
+            lname, rname = lhs.name, rhs.name
+            return lambda namespace: op(
+                namespace.get(lname, 0), namespace.get(rname, 0)
+            )
+
+        lhs, rhs = lhs.compile(), rhs.compile()
+        return lambda namespace: op(lhs(namespace), rhs(namespace))
+
     def __str__(self):
         lhs = (
             str(self.lhs)
@@ -169,91 +417,92 @@ class _BinNode(ASTNode):
 
 
 class MulNode(_BinNode):
+    __slots__ = ()
     op = "*"
+    function = operator.mul
 
     def visit(self, *args):
         return self.lhs.visit(*args) * self.rhs.visit(*args)
 
-    def numeric(self):
-        return 4 + 5 * phi(self.lhs.numeric(), self.rhs.numeric())
-
 
 class DivNode(_BinNode):
+    __slots__ = ()
     op = "/"
+    function = operator.truediv
 
     def visit(self, *args):
         return self.lhs.visit(*args) / self.rhs.visit(*args)
 
 
 class AddNode(_BinNode):
+    __slots__ = ()
     op = "+"
+    function = operator.add
 
     def visit(self, *args):
         return self.lhs.visit(*args) + self.rhs.visit(*args)
 
-    def numeric(self):
-        return 2 + 5 * phi(self.lhs.numeric(), self.rhs.numeric())
-
 
 class SubNode(_BinNode):
+    __slots__ = ()
     op = "-"
+    function = operator.sub
 
     def visit(self, *args):
         return self.lhs.visit(*args) - self.rhs.visit(*args)
 
-    def numeric(self):
-        return 3 + 5 * phi(self.lhs.numeric(), self.rhs.numeric())
-
 
 class EqNode(_BinNode):
+    __slots__ = ()
     op = "="
+    function = operator.eq
 
     def visit(self, *args):
         return self.lhs.visit(*args) == self.rhs.visit(*args)
 
-    def numeric(self):
-        return 2 + 4 * phi(self.lhs.numeric(), self.rhs.numeric())
-
 
 class AndNode(_BinNode):
+    __slots__ = ()
     op = "&"
 
     def visit(self, *args):
         return self.lhs.visit(*args) and self.rhs.visit(*args)
 
-    def numeric(self):
-        if (
-            isinstance(self.lhs, VariableNode)
-            or isinstance(self.rhs, VariableNode)
-        ):
-            raise NotImplementedError(
-                "Boolean and must not operate on variables directly."
-            )
-        return 5 + 4 * phi(self.lhs.numeric(), self.rhs.numeric())
+    def compile(self):
+        lhs, rhs = self.lhs.compile(), self.rhs.compile()
+        return lambda namespace: lhs(namespace) and rhs(namespace)
 
 
 class OrNode(_BinNode):
+    __slots__ = ()
     op = "|"
 
     def visit(self, *args):
         return self.lhs.visit(*args) or self.rhs.visit(*args)
 
-    def numeric(self):
-        # a | b === ¬(¬a & ¬b)
-        return NotNode(
-            OrNode(
-                NotNode(self.lhs),
-                NotNode(self.rhs)
-            )
-        ).numeric()
+    def compile(self):
+        lhs, rhs = self.lhs.compile(), self.rhs.compile()
+        return lambda namespace: lhs(namespace) or rhs(namespace)
 
 
 class CmpNode(_BinNode):
+    __slots__ = ("mode", )
+    OPERATORS = {
+        ">": operator.gt,
+        ">=": operator.ge,
+        "<": operator.lt,
+        "<=": operator.le,
+    }
+
     def __init__(self, lhs, mode, rhs):
         self.lhs = lhs
         self.mode = mode
         self.rhs = rhs
 
+    @property
+    def function(self):
+        return self.OPERATORS.get(self.mode, lambda lhs, rhs: False)
+
     def __str__(self):
         return f"({self.lhs}) {self.mode} ({self.rhs})"
 
@@ -270,21 +519,10 @@ class CmpNode(_BinNode):
             return lhs <= rhs
         return False
 
-    def numeric(self):
-        if self.mode == "<=":
-            return 3 + 4 * phi(self.lhs.numeric(), self.rhs.numeric())
-        elif self.mode == ">=":
-            # a >= b === b <= a
-            return 3 + 4 * phi(self.rhs.numeric(), self.lhs.numeric())
-        elif self.mode == ">":
-            # a > b === ¬(a <= b)
-            return NotNode(CmpNode(self.lhs, "<=", self.rhs)).numeric()
-        elif self.mode == "<":
-            # b > a === ¬(b <= a)
-            return NotNode(CmpNode(self.rhs, "<=", self.lhs)).numeric()
-
 
 class VariableNode(ASTNode):
+    __slots__ = ("name", )
+
     def __init__(self, name):
         self.name = name
 
@@ -294,11 +532,14 @@ class VariableNode(ASTNode):
     def visit(self, namespace, *args):
         return namespace.get(self.name, 0)
 
-    def numeric(self):
-        return 1 + 5 * numeric_name(self.name)
+    def compile(self):
+        name = self.name
+        return lambda namespace: namespace.get(name, 0)
 
 
 class TraceNode(ASTNode):
+    __slots__ = ("location", )
+
     def __init__(self, location):
         self.location = location
 
@@ -311,11 +552,10 @@ class TraceNode(ASTNode):
         for i in namespace:
             print(f"  {i} := {namespace[i]}")
 
-    def numeric(self):
-        return SkipNode().numeric()
-
 
 class ExitNode(ASTNode):
+    __slots__ = ()
+
     def __str__(self):
         return "@exit"
 
@@ -324,6 +564,8 @@ class ExitNode(ASTNode):
 
 
 class PrintNode(ASTNode):
+    __slots__ = ("name", )
+
     def __init__(self, name):
         self.name = name
 
@@ -333,11 +575,10 @@ class PrintNode(ASTNode):
     def visit(self, namespace, *args):
         print(f"{self.name} := {namespace.get(self.name, 0)}")
 
-    def numeric(self):
-        return SkipNode().numeric()
-
 
 class ResetNode(ASTNode):
+    __slots__ = ()
+
     def __str__(self):
         return "@reset"
 
@@ -346,20 +587,36 @@ class ResetNode(ASTNode):
 
 
 class HelpNode(ASTNode):
+    __slots__ = ()
+
     def __str__(self):
         return "@help"
 
     def visit(self, *args):
         print(HELP_MESSAGE)
 
-    def numeric(self):
-        return SkipNode().numeric()
+
+class CacheNode(ASTNode):
+    __slots__ = ()
+
+    def __str__(self):
+        return "@cache"
+
+    def visit(self, *args):
+        print(f"Encode cache: {ENCODE_CACHE}")
+        print(f"Decode cache: {DECODE_CACHE}")
+        print(f"Compiled code cache: {CODE_CACHE}")
 
 
 class NumericNode(ASTNode):
+    __slots__ = ("suite", )
+
     def __init__(self, suite):
         self.suite = suite
 
+    def children(self):
+        return (self.suite, )
+
     def __str__(self):
         return f"@numeric {self.suite}"
 
@@ -368,25 +625,30 @@ class NumericNode(ASTNode):
 
 
 class FromNumericNode(ASTNode):
+    __slots__ = ("mode", "num")
+
     def __init__(self, mode, num):
         self.mode = mode
         self.num = num
 
+    def children(self):
+        return (self.num, )
+
     def __str__(self):
         return f"@from_numeric {self.mode} {self.num}"
 
+    DECODERS = {"a": arith_from_num, "b": bool_from_num, "stmt": stmt_from_num}
+
     def visit(self, *args):
         num = self.num.visit(*args)
-        if self.mode == "a":
-            return arith_from_num(num)
-        elif self.mode == "b":
-            return bool_from_num(num)
-        elif self.mode == "stmt":
-            return stmt_from_num(num)
+        if self.mode in self.DECODERS:
+            return self.DECODERS[self.mode](num)
         return SkipNode()
 
 
 class RunNumericNode(FromNumericNode):
+    __slots__ = ()
+
     def __init__(self, mode, num):
         self.mode = mode
         self.num = num
@@ -397,8 +659,28 @@ class RunNumericNode(FromNumericNode):
     def visit(self, *args):
         return super().visit(*args).visit(*args)
 
+    def compile(self):
+        num = self.num.compile()
+        decode = self.DECODERS.get(self.mode)
+        if decode is None:
+            return lambda namespace: None
+        # What each number decoded and compiled to, so that running the same
+        # number again, say on every iteration of a loop, does neither again
+        programs = LRUCache(CODE_CACHE.size)
+
+        def run_numeric(namespace):
+            value = num(namespace)
+            program = programs.get(value)
+            if program is None:
+                program = compile_code(decode(value))
+                programs.put(value, program)
+            return program(namespace)
+        return run_numeric
+
 
 class EvalNode(ASTNode):
+    __slots__ = ("var", )
+
     def __init__(self, var):
         self.var = var
 
@@ -407,5 +689,79 @@ class EvalNode(ASTNode):
 
     def visit(self, namespace, *args):
         if isinstance(namespace.get(self.var), ASTNode):
-            return namespace[self.var].visit(*args)
+            return namespace[self.var].visit(namespace, *args)
         raise WhileError("Cannot evaluate non-code variable")
+
+    def compile(self):
+        var = self.var
+
+        def eval_(namespace):
+            code = namespace.get(var)
+            if isinstance(code, ASTNode):
+                return compile_code(code)(namespace)
+            raise WhileError("Cannot evaluate non-code variable")
+        return eval_
+
+
+def compile_code(node):
+    # The compiled form of a tree being run as code, compiling it only the
+    # first time it's run
+    entry = CODE_CACHE.get(id(node))
+    if entry is None:
+        entry = (node, node.compile())
+        CODE_CACHE.put(id(node), entry)
+    return entry[1]
+
+
+def _key(value):
+    # Nodes are keyed by identity, as those built by a NodeFactory are
+    # already shared, and anything else by value, along with its type for
+    # the same reason nodes compare by it
+    if isinstance(value, ASTNode):
+        return id(value)
+    if isinstance(value, list):
+        return (list, tuple(map(_key, value)))
+    return (type(value), value)
+
+
+class NodeFactory:
+    # Builds nodes so that building one identical to one built before hands
+    # back the earlier node rather than a copy. Children are built first,
+    # so are shared already and can be told apart by identity, which keeps
+    # the cost of each lookup constant however large the subtree. A node
+    # holds its children, so none of the identities used as keys can be
+    # reused while the factory holds the node.
+    # Shared nodes mustn't be modified, so only those which never are after
+    # being built should be built this way.
+    def __init__(self):
+        self._nodes = {}
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def make(self, build, *args):
+        key = (build, ) + tuple(map(_key, args))
+        node = self._nodes.get(key)
+        if node is None:
+            node = self._nodes[key] = build(*args)
+        return node
+
+    # Quicker forms of make for the nodes built most often, which skip
+    # working out how to key each argument
+
+    def leaf(self, build, value):
+        key = (build, type(value), value)
+        node = self._nodes.get(key)
+        if node is None:
+            node = self._nodes[key] = build(value)
+        return node
+
+    def binary(self, build, lhs, rhs):
+        key = (build, id(lhs), id(rhs))
+        node = self._nodes.get(key)
+        if node is None:
+            node = self._nodes[key] = build(lhs, rhs)
+        return node
+
+    def clear(self):
+        self._nodes.clear()
@@ -1,78 +1,295 @@
-from .util import from_numeric_name, phi_prime
+import itertools
 
+from .cache import LRUCache
+from .errors import WhileError
+from .util import from_numeric_name, phi_prime, phi, beta, numeric_name
 
-def arith_from_num(num):
-    from .nodes import ConstantNode, VariableNode, AddNode, SubNode, MulNode
-
-    if num % 5 == 0:
-        n = int(num / 5)
-        return ConstantNode(n)
-    elif num % 5 == 1:
-        x = from_numeric_name(int((num - 1) // 5))
-        return VariableNode(x)
-    else:
-        remainder = num % 5
-
-        a = int((num - remainder) // 5)
-        a1, a2 = phi_prime(a)
-        a1 = arith_from_num(a1)
-        a2 = arith_from_num(a2)
-
-        if remainder == 2:
-            return AddNode(a1, a2)
-        if remainder == 3:
-            return SubNode(a1, a2)
-        if remainder == 4:
-            return MulNode(a1, a2)
+# Numbers already encoded, keyed by the structure of the tree they encode,
+# and trees already decoded, keyed by the number they were decoded from.
+# Decoded trees are shared between everything decoded from the same number,
+# so must not be modified.
+ENCODE_CACHE = LRUCache()
+DECODE_CACHE = LRUCache()
+# What code run by @eval and @run_numeric compiled to, keyed by the identity
+# of its tree. Each entry holds on to its tree, so the identity can't be
+# reused by another while the entry is cached.
+CODE_CACHE = LRUCache()
+# Identifies each structure in ENCODE_CACHE, so that the keys of its parents
+# needn't include the whole of it
+_structure_ids = itertools.count()
 
 
-def bool_from_num(num):
-    from .nodes import ConstantNode, EqNode, CmpNode, NotNode, AndNode
-
-    if num == 0:
-        return ConstantNode(True)
-    elif num == 1:
-        return ConstantNode(False)
-    if num % 4 == 2 or num % 4 == 3:
-        remainder = num % 5
-
-        a = int((num - remainder) // 4)
-        a1, a2 = phi_prime(a)
-        a1 = arith_from_num(a1)
-        a2 = arith_from_num(a2)
-
-        if remainder == 3:
-            return EqNode(a1, a2)
+def set_cache_size(size):
+    ENCODE_CACHE.resize(size)
+    DECODE_CACHE.resize(size)
+    CODE_CACHE.resize(size)
+
+
+def _decode(kind, num):
+    from .nodes import (
+        ConstantNode, VariableNode, AddNode, SubNode, MulNode, EqNode,
+        CmpNode, NotNode, AndNode, SkipNode, WhileNode, AssignNode,
+        SuiteNode, IfNode, NodeFactory
+    )
+
+    if num < 0:
+        raise WhileError("Gödel numbers cannot be negative")
+
+    # As with encoding, an explicit stack of numbers still to be decoded, as
+    # (kind, num), and of how to build a node from the last few decoded, as
+    # (build, count, key)
+    stack = [(kind, num)]
+    values = []
+    # Identical subtrees are shared throughout the tree, including small
+    # ones the cache doesn't hold and any it has evicted
+    nodes = NodeFactory()
+    while stack:
+        item = stack.pop()
+        if len(item) == 3:
+            build, count, key = item
+            args = values[-count:]
+            del values[-count:]
+            node = nodes.make(build, *args)
+            DECODE_CACHE.put(key, node)
+            values.append(node)
+            continue
+
+        kind, num = item
+        if num >= 5:
+            node = DECODE_CACHE.get(item)
+            if node is not None:
+                values.append(node)
+                continue
+
+        if kind == "a":
+            num, remainder = divmod(num, 5)
+            if remainder == 0:
+                values.append(nodes.leaf(ConstantNode, num))
+                continue
+            if remainder == 1:
+                values.append(
+                    nodes.leaf(VariableNode, from_numeric_name(num))
+                )
+                continue
+            a1, a2 = phi_prime(num)
+            build = (None, None, AddNode, SubNode, MulNode)[remainder]
+            stack.append((build, 2, item))
+            stack.append(("a", a2))
+            stack.append(("a", a1))
+
+        elif kind == "b":
+            if num < 2:
+                values.append(nodes.leaf(ConstantNode, num == 0))
+                continue
+            num, remainder = divmod(num - 2, 4)
+            if remainder == 2:
+                stack.append((NotNode, 1, item))
+                stack.append(("b", num))
+                continue
+            first, second = phi_prime(num)
+            if remainder == 0:
+                stack.append((EqNode, 2, item))
+                kind = "a"
+            elif remainder == 1:
+                stack.append((_less_equal, 2, item))
+                kind = "a"
+            else:
+                stack.append((AndNode, 2, item))
+            stack.append((kind, second))
+            stack.append((kind, first))
+
         else:
-            return CmpNode(a1, "<=", a2)
-    elif num % 4 == 0:
-        return NotNode(bool_from_num(int(num // 4)))
-    elif num % 4 == 1:
-        b = int((num - 1) // 4)
-        b1, b2 = phi_prime(b)
-        b1 = bool_from_num(b1)
-        b2 = bool_from_num(b2)
+            if num == 0:
+                values.append(nodes.make(SkipNode))
+                continue
+            num, remainder = divmod(num - 1, 4)
+            first, second = phi_prime(num)
+            if remainder == 0:
+                stack.append((WhileNode, 2, item))
+                stack.append(("stmt", second))
+                stack.append(("b", first))
+            elif remainder == 1:
+                values.append(from_numeric_name(first))
+                stack.append((AssignNode, 2, item))
+                stack.append(("a", second))
+            elif remainder == 2:
+                stack.append((_suite, 2, item))
+                stack.append(("stmt", second))
+                stack.append(("stmt", first))
+            else:
+                S1, S2 = phi_prime(second)
+                stack.append((IfNode, 3, item))
+                stack.append(("stmt", S2))
+                stack.append(("stmt", S1))
+                stack.append(("b", first))
+
+    return values[0]
+
+
+def _less_equal(a1, a2):
+    from .nodes import CmpNode
+    return CmpNode(a1, "<=", a2)
+
+
+def _suite(S1, S2):
+    from .nodes import SuiteNode
+    return SuiteNode([S1, S2])
 
-        return AndNode(b1, b2)
+
+def arith_from_num(num):
+    return _decode("a", num)
+
+
+def bool_from_num(num):
+    return _decode("b", num)
 
 
 def stmt_from_num(num):
-    from .nodes import SkipNode, WhileNode, AssignNode, SuiteNode, IfNode
-
-    if num == 0:
-        return SkipNode()
-    elif num % 4 == 1:
-        b, S = phi_prime(int((num - 1) // 4))
-        return WhileNode(bool_from_num(b), stmt_from_num(S))
-    elif num % 4 == 2:
-        x, a = phi_prime(int((num - 2) // 4))
-        x = from_numeric_name(x)
-        a = arith_from_num(a)
-        return AssignNode(x, a)
-    elif num % 4 == 3:
-        S1, S2 = phi_prime(int((num - 3) // 4))
-        return SuiteNode([stmt_from_num(S1), stmt_from_num(S2)])
-    elif num % 4 == 0:
-        b, S = phi_prime(int((num - 4) // 4))
-        S1, S2 = phi_prime(S)
-        return IfNode(bool_from_num(b), stmt_from_num(S1), stmt_from_num(S2))
+    return _decode("stmt", num)
+
+
+def _sequence(*statements):
+    # S1; S2; ...; Sn is encoded as S1; (S2; (...; Sn))
+    val = statements[-1]
+    for i in statements[-2::-1]:
+        val = 3 + 4 * phi(i, val)
+    return val
+
+
+# How to combine the numbers of a node's children into its own number, with
+# the children given in the order they're encoded in
+_COMBINE = {
+    "suite": _sequence,
+    "if": lambda b, S1, S2=0: 4 + 4 * phi(b, phi(S1, S2)),
+    "while": lambda b, S: 1 + 4 * phi(b, S),
+    "assign": lambda x, a: 2 + 4 * phi(x, a),
+    "mul": lambda a1, a2: 4 + 5 * phi(a1, a2),
+    "add": lambda a1, a2: 2 + 5 * phi(a1, a2),
+    "sub": lambda a1, a2: 3 + 5 * phi(a1, a2),
+    "eq": lambda a1, a2: 2 + 4 * phi(a1, a2),
+    "le": lambda a1, a2: 3 + 4 * phi(a1, a2),
+    # a > b === ¬(a <= b)
+    "gt": lambda a1, a2: 4 + 4 * (3 + 4 * phi(a1, a2)),
+    "not": lambda b: 4 + 4 * b,
+    "and": lambda b1, b2: 5 + 4 * phi(b1, b2),
+    # a | b === ¬(¬a & ¬b)
+    "or": lambda b1, b2: 4 + 4 * (5 + 4 * phi(4 + 4 * b1, 4 + 4 * b2)),
+}
+
+
+def num_from_node(node):
+    from .nodes import (
+        SuiteNode, IfNode, WhileNode, SkipNode, AssignNode, ConstantNode,
+        NotNode, MulNode, AddNode, SubNode, EqNode, AndNode, OrNode, CmpNode,
+        VariableNode, TraceNode, PrintNode, HelpNode, CacheNode
+    )
+
+    # Post-order over an explicit stack, so that programs of any depth can be
+    # encoded. Entries are either nodes still to be encoded, or which kind of
+    # node to combine the last few values into once all of a node's children
+    # have been. Each value is a key identifying the structure encoded, along
+    # with its number.
+    stack = [node]
+    values = []
+    while stack:
+        node = stack.pop()
+        if type(node) is tuple:
+            kind, count = node
+            args = values[-count:]
+            del values[-count:]
+            key = (kind, ) + tuple(i[0] for i in args)
+            value = ENCODE_CACHE.get(key)
+            if value is None:
+                value = (
+                    next(_structure_ids),
+                    _COMBINE[kind](*(i[1] for i in args)),
+                )
+                ENCODE_CACHE.put(key, value)
+            values.append(value)
+            continue
+
+        if isinstance(
+            node, (SkipNode, TraceNode, PrintNode, HelpNode, CacheNode)
+        ):
+            values.append((("skip", ), 0))
+        elif isinstance(node, ConstantNode):
+            value = node.value
+            if isinstance(value, float):
+                raise NotImplementedError(
+                    "Floats disallowed in canonical while"
+                )
+            # Keyed by type as well, as true and 1 compare equal
+            key = ("constant", type(value), value)
+            if isinstance(value, bool):
+                values.append((key, 1 - value))
+            else:
+                values.append((key, 5 * beta(value)))
+        elif isinstance(node, VariableNode):
+            values.append((
+                ("variable", node.name), 1 + 5 * numeric_name(node.name)
+            ))
+        elif isinstance(node, SuiteNode):
+            statements = node.statements
+            if not statements:
+                values.append((("skip", ), 0))
+            elif len(statements) == 1:
+                stack.append(statements[0])
+            else:
+                stack.append(("suite", len(statements)))
+                stack.extend(reversed(statements))
+        elif isinstance(node, IfNode):
+            if node.else_body is None:
+                stack.append(("if", 2))
+            else:
+                stack.append(("if", 3))
+                stack.append(node.else_body)
+            stack.append(node.body)
+            stack.append(node.condition)
+        elif isinstance(node, WhileNode):
+            stack.append(("while", 2))
+            stack.append(node.body)
+            stack.append(node.condition)
+        elif isinstance(node, AssignNode):
+            values.append((("name", node.name), numeric_name(node.name)))
+            stack.append(("assign", 2))
+            stack.append(node.value)
+        elif isinstance(node, NotNode):
+            stack.append(("not", 1))
+            stack.append(node.expr)
+        elif isinstance(node, (
+            MulNode, AddNode, SubNode, EqNode, AndNode, OrNode, CmpNode
+        )):
+            lhs, rhs = node.lhs, node.rhs
+            if isinstance(node, MulNode):
+                kind = "mul"
+            elif isinstance(node, AddNode):
+                kind = "add"
+            elif isinstance(node, SubNode):
+                kind = "sub"
+            elif isinstance(node, EqNode):
+                kind = "eq"
+            elif isinstance(node, AndNode):
+                if (
+                    isinstance(lhs, VariableNode)
+                    or isinstance(rhs, VariableNode)
+                ):
+                    raise NotImplementedError(
+                        "Boolean and must not operate on variables directly."
+                    )
+                kind = "and"
+            elif isinstance(node, OrNode):
+                kind = "or"
+            else:
+                # a >= b === b <= a, and a < b === b > a
+                kind = "le" if node.mode in ("<=", ">=") else "gt"
+                if node.mode in (">=", "<"):
+                    lhs, rhs = rhs, lhs
+            stack.append((kind, 2))
+            stack.append(rhs)
+            stack.append(lhs)
+        else:
+            raise WhileError(
+                f"Node {node.__class__.__name__} does not implement numeric()"
+            )
+
+    return values[0][1]
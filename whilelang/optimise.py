@@ -0,0 +1,240 @@
+from .analysis import induction_loop
+from .nodes import (
+    SuiteNode, IfNode, WhileNode, SkipNode, AssignNode, ConstantNode,
+    NotNode, _BinNode, AndNode, OrNode, CmpNode, EqNode, VariableNode,
+    MulNode, AddNode, SubNode, FromNumericNode
+)
+
+
+def count_nodes(node):
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.children())
+    return count
+
+
+class Optimiser:
+    # -O1: constant folding, short-circuiting constant & and |, and removal
+    #      of skip statements and redundant nesting of suites
+    # -O2: additionally drops if/while branches with constant conditions,
+    #      simplifies arithmetic identities, and replaces loops that only
+    #      step variables by constant amounts with their closed form
+    LEVELS = (0, 1, 2)
+
+    def __init__(self, level=1):
+        self.level = level
+        self.removed = 0
+
+    def optimise(self, ast):
+        if self.level <= 0:
+            return ast
+
+        before = count_nodes(ast)
+        # The value of the final statement of a program is printed by the
+        # REPL, so we must be careful not to change what it evaluates to.
+        ast = self.statement(ast, tail=True)
+        self.removed += before - count_nodes(ast)
+        return ast
+
+    @staticmethod
+    def _constant(node):
+        return isinstance(node, ConstantNode)
+
+    @staticmethod
+    def _int(node, value=None):
+        # Only plain integers, as `true + 0` is 1 rather than true
+        return (
+            isinstance(node, ConstantNode)
+            and type(node.value) is int
+            and (value is None or node.value == value)
+        )
+
+    def _integral(self, node):
+        # Nodes that always evaluate to an integer, if they don't raise
+        return self._int(node) or isinstance(node, (AddNode, SubNode, MulNode))
+
+    def _boolean(self, node):
+        # Nodes that always evaluate to a boolean
+        if isinstance(node, ConstantNode):
+            return type(node.value) is bool
+        if isinstance(node, (AndNode, OrNode)):
+            return self._boolean(node.lhs) and self._boolean(node.rhs)
+        return isinstance(node, (NotNode, CmpNode, EqNode))
+
+    def _pure(self, node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if not isinstance(
+                node, (ConstantNode, VariableNode, NotNode, _BinNode)
+            ):
+                return False
+            stack.extend(node.children())
+        return True
+
+    def _valueless(self, node):
+        # Statements which evaluate to None, as skip does
+        if isinstance(node, SuiteNode):
+            return bool(node.statements) and self._valueless(
+                node.statements[-1]
+            )
+        return isinstance(node, (SkipNode, AssignNode, IfNode, WhileNode))
+
+    def _fold(self, node):
+        try:
+            return ConstantNode(node.visit({}))
+        except Exception:
+            # Leave anything that would fail at runtime to fail at runtime
+            return node
+
+    def expr(self, node):
+        if isinstance(node, NotNode):
+            expr = self.expr(node.expr)
+            if self._constant(expr):
+                return self._fold(NotNode(expr))
+            if (
+                self.level >= 2
+                and isinstance(expr, NotNode)
+                and self._boolean(expr.expr)
+            ):
+                # ¬¬a is only a when a is already a boolean
+                return expr.expr
+            return NotNode(expr)
+
+        if isinstance(node, (AndNode, OrNode)):
+            lhs, rhs = self.expr(node.lhs), self.expr(node.rhs)
+            if self._constant(lhs):
+                # & and | evaluate to one of their operands, so a constant
+                # lhs decides which
+                if bool(lhs.value) == isinstance(node, AndNode):
+                    return rhs
+                return lhs
+            if (
+                self.level >= 2
+                and self._constant(rhs)
+                and self._boolean(lhs)
+            ):
+                # a & true, a | false => a, and a & false, a | true are
+                # constant so long as evaluating a has no side effects
+                if bool(rhs.value) == isinstance(node, AndNode):
+                    return lhs
+                if self._pure(lhs):
+                    return rhs
+            return type(node)(lhs, rhs)
+
+        if isinstance(node, _BinNode):
+            lhs, rhs = self.expr(node.lhs), self.expr(node.rhs)
+            if isinstance(node, CmpNode):
+                node = CmpNode(lhs, node.mode, rhs)
+            else:
+                node = type(node)(lhs, rhs)
+
+            if self._constant(lhs) and self._constant(rhs):
+                return self._fold(node)
+            if self.level >= 2:
+                return self._simplify(node)
+            return node
+
+        if isinstance(node, FromNumericNode):
+            return type(node)(node.mode, self.statement(node.num, tail=True))
+
+        return node
+
+    def _simplify(self, node):
+        lhs, rhs = node.lhs, node.rhs
+        if isinstance(node, AddNode):
+            if self._int(lhs, 0) and self._integral(rhs):
+                return rhs
+            if self._int(rhs, 0) and self._integral(lhs):
+                return lhs
+        elif isinstance(node, SubNode):
+            if self._int(rhs, 0) and self._integral(lhs):
+                return lhs
+        elif isinstance(node, MulNode):
+            if self._int(lhs, 1) and self._integral(rhs):
+                return rhs
+            if self._int(rhs, 1) and self._integral(lhs):
+                return lhs
+            if (
+                (self._int(lhs, 0) or self._int(rhs, 0))
+                and self._integral(lhs) and self._integral(rhs)
+                and self._pure(lhs) and self._pure(rhs)
+            ):
+                return ConstantNode(0)
+        return node
+
+    def statement(self, node, tail=False):
+        if isinstance(node, SuiteNode):
+            return self._suite(node, tail)
+
+        if isinstance(node, AssignNode):
+            return AssignNode(
+                node.name, self.expr(node.value), node.location
+            )
+
+        if isinstance(node, IfNode):
+            condition = self.expr(node.condition)
+            body = self.statement(node.body)
+            else_body = (
+                None if node.else_body is None
+                else self.statement(node.else_body)
+            )
+            if self.level >= 2 and self._constant(condition):
+                branch = body if condition.value else else_body
+                if branch is None:
+                    return SkipNode()
+                if tail:
+                    # An if statement evaluates to None, where its branch
+                    # might not
+                    return self._suite(SuiteNode([branch, SkipNode()]), tail)
+                return branch
+            return IfNode(condition, body, else_body, node.location)
+
+        if isinstance(node, WhileNode):
+            condition = self.expr(node.condition)
+            if (
+                self.level >= 2
+                and self._constant(condition)
+                and not condition.value
+            ):
+                return SkipNode()
+            node = WhileNode(
+                condition, self.statement(node.body), node.location
+            )
+            if self.level >= 2:
+                node = induction_loop(node) or node
+            return node
+
+        return self.expr(node)
+
+    def _suite(self, node, tail):
+        statements = []
+        last = len(node.statements) - 1
+        for n, i in enumerate(node.statements):
+            i = self.statement(i, tail and n == last)
+            # Nested suites only group statements, so can be flattened
+            if isinstance(i, SuiteNode):
+                statements.extend(i.statements)
+            else:
+                statements.append(i)
+
+        body = [i for i in statements[:-1] if not isinstance(i, SkipNode)]
+        if statements:
+            last = statements[-1]
+            if not (
+                isinstance(last, SkipNode)
+                and (not tail or (body and self._valueless(body[-1])))
+            ):
+                body.append(last)
+
+        if len(body) == 1:
+            return body[0]
+        return SuiteNode(body)
+
+
+def optimise(ast, level=1):
+    optimiser = Optimiser(level)
+    return optimiser.optimise(ast), optimiser.removed
@@ -1,27 +1,96 @@
 from .base_parser import BaseParser
 from .const import DIRECTIVE, NUMBER, SYMBOL, NAME, KEYWORD, BOOLEAN, EOF, ANY
+from .errors import WhileSyntaxError
 from .nodes import (
     EvalNode, SuiteNode, SkipNode, IfNode, WhileNode, AssignNode, VariableNode, NotNode,
     ConstantNode, MulNode, SubNode, AddNode, CmpNode, EqNode, AndNode, OrNode,
     TraceNode, ExitNode, PrintNode, HelpNode, ResetNode, NumericNode,
-    FromNumericNode, RunNumericNode
+    FromNumericNode, RunNumericNode, CacheNode, NodeFactory
 )
 
 
 class Parser(BaseParser):
+    def __init__(self, lexer, recover=False):
+        # How many brackets are currently open, so recovery knows which
+        # closing bracket ends the suite it is in
+        self._depth = 0
+        # Expressions and skips are shared wherever they're repeated, as
+        # none of them are modified once built
+        self._nodes = NodeFactory()
+        super().__init__(lexer, recover)
+
+    def eat(self, token=None, meta=None):
+        last = super().eat(token, meta)
+        if last.type == SYMBOL:
+            if last.meta == "(":
+                self._depth += 1
+            elif last.meta == ")":
+                self._depth -= 1
+        return last
+
+    def _synchronise(self, depth):
+        # Skip the rest of a statement that failed to parse. Returns whether
+        # another statement follows it in the same suite.
+        while self._cur.type != EOF:
+            if self._cur.type == SYMBOL:
+                if self._cur.meta == ";" and self._depth <= depth:
+                    self.eat()
+                    return True
+                if self._cur.meta == ")" and depth and self._depth <= depth:
+                    return False
+            self.eat()
+        return False
+
     def program(self):
         suite = self.suite()
+        while self._recover and self._cur.type != EOF:
+            try:
+                self.eat(EOF)
+            except WhileSyntaxError as e:
+                self._errors.append(e)
+            self._synchronise(0)
+            suite.statements.extend(self.suite().statements)
         self.eat(EOF)
         return suite
 
-    def suite(self):
-        statements = []
+    def statements(self):
+        # Parses the program one top-level statement at a time, yielding
+        # each as soon as it's complete, so that it can be run before the
+        # rest of the program has been read
         while self._cur.type != EOF:
             if self.try_eat(SYMBOL, "("):
-                statements.append(self.suite())
+                statement = self.suite()
                 self.eat(SYMBOL, ")")
             else:
-                statements.append(self.statement())
+                statement = self.statement()
+            yield statement
+            # Keeping every expression seen so far to share would hold on to
+            # the whole program
+            self._nodes.clear()
+
+            if self._cur.type == EOF:
+                break
+            if not self.try_eat(SYMBOL, ";"):
+                break
+        self.eat(EOF)
+
+    def suite(self):
+        statements = []
+        depth = self._depth
+        while self._cur.type != EOF:
+            try:
+                if self.try_eat(SYMBOL, "("):
+                    statements.append(self.suite())
+                    self.eat(SYMBOL, ")")
+                else:
+                    statements.append(self.statement())
+            except WhileSyntaxError as e:
+                if not self._recover:
+                    raise
+                self._errors.append(e)
+                if self._synchronise(depth):
+                    continue
+                break
 
             if self._cur.type == EOF:
                 break
@@ -46,7 +115,7 @@ class Parser(BaseParser):
 
         if token.type == KEYWORD:
             if token.meta == "skip":
-                return SkipNode()
+                return self._nodes.make(SkipNode)
             elif token.meta == "if":
                 if_condition = self.expr_a()
                 self.eat(KEYWORD, "then")
@@ -55,17 +124,19 @@ class Parser(BaseParser):
                     if_else = self.suite()
                 else:
                     if_else = None
-                return IfNode(if_condition, if_body, if_else)
+                return IfNode(if_condition, if_body, if_else, token.location)
             elif token.meta == "while":
                 while_condition = self.expr_a()
                 self.eat(KEYWORD, "do")
                 while_body = self.suite()
-                return WhileNode(while_condition, while_body)
+                return WhileNode(
+                    while_condition, while_body, token.location
+                )
         elif token.type == NAME:
             name = token.meta
             self.eat(SYMBOL, ":=")
             value = self.expr_a()
-            return AssignNode(name, value)
+            return AssignNode(name, value, token.location)
 
     def factor(self):
         negate = False
@@ -84,7 +155,7 @@ class Parser(BaseParser):
             token = self.expr_a()
             self.eat(SYMBOL, ")")
         elif token.type == NAME:
-            token = VariableNode(token.meta)
+            token = self._nodes.leaf(VariableNode, token.meta)
         elif token.type == DIRECTIVE:
             if token.meta == "trace":
                 return TraceNode(token.location)
@@ -92,6 +163,8 @@ class Parser(BaseParser):
                 return ExitNode()
             elif token.meta == "help":
                 return HelpNode()
+            elif token.meta == "cache":
+                return CacheNode()
             elif token.meta == "reset":
                 return ResetNode()
             elif token.meta == "print":
@@ -107,27 +180,27 @@ class Parser(BaseParser):
             else:
                 self._error(f"Unknown directive '{token.meta}'", token)
         else:
-            token = ConstantNode(token.meta)
+            token = self._nodes.leaf(ConstantNode, token.meta)
         if negate:
-            token = NotNode(token)
+            token = self._nodes.make(NotNode, token)
         return token
 
     def expr_f(self):
         node = self.factor()
         while self._cur.type == SYMBOL and self._cur.meta in ("*", "/"):
             if self.try_eat(SYMBOL, "*"):
-                node = MulNode(node, self.factor())
+                node = self._nodes.binary(MulNode, node, self.factor())
             if self.try_eat(SYMBOL, "/"):
-                node = SubNode(node, self.factor())
+                node = self._nodes.binary(SubNode, node, self.factor())
         return node
 
     def expr_e(self):
         node = self.expr_f()
         while self._cur.type == SYMBOL and self._cur.meta in ("+", "-"):
             if self.try_eat(SYMBOL, "+"):
-                node = AddNode(node, self.expr_f())
+                node = self._nodes.binary(AddNode, node, self.expr_f())
             if self.try_eat(SYMBOL, "-"):
-                node = SubNode(node, self.expr_f())
+                node = self._nodes.binary(SubNode, node, self.expr_f())
         return node
 
     def expr_d(self):
@@ -137,26 +210,28 @@ class Parser(BaseParser):
             and self._cur.meta in ("<=", "<", ">", ">=")
         ):
             sym = self.eat(SYMBOL)
-            node = CmpNode(node, sym.meta, self.expr_e())
+            node = self._nodes.make(
+                CmpNode, node, sym.meta, self.expr_e()
+            )
         return node
 
     def expr_c(self):
         node = self.expr_d()
         while self._cur.type == SYMBOL and self._cur.meta in ("=", ):
             if self.try_eat(SYMBOL, "="):
-                node = EqNode(node, self.expr_d())
+                node = self._nodes.binary(EqNode, node, self.expr_d())
         return node
 
     def expr_b(self):
         node = self.expr_c()
         while self._cur.type == SYMBOL and self._cur.meta in ("&", ):
             if self.try_eat(SYMBOL, "&"):
-                node = AndNode(node, self.expr_c())
+                node = self._nodes.binary(AndNode, node, self.expr_c())
         return node
 
     def expr_a(self):
         node = self.expr_b()
         while self._cur.type == SYMBOL and self._cur.meta in ("|", ):
             if self.try_eat(SYMBOL, "|"):
-                node = OrNode(node, self.expr_b())
+                node = self._nodes.binary(OrNode, node, self.expr_b())
         return node
@@ -0,0 +1,102 @@
+from time import perf_counter_ns
+
+from .nodes import (
+    ASTNode, SuiteNode, IfNode, WhileNode, AssignNode, InductionLoopNode
+)
+
+
+class ProfiledNode(ASTNode):
+    # Counts and times every execution of the statement it wraps. Time is
+    # cumulative, so includes any statements nested inside it.
+    __slots__ = ("node", "stats")
+
+    def __init__(self, node, stats):
+        self.node = node
+        self.stats = stats
+
+    def children(self):
+        return (self.node, )
+
+    def __str__(self):
+        return str(self.node)
+
+    def visit(self, *args):
+        stats = self.stats
+        start = perf_counter_ns()
+        try:
+            return self.node.visit(*args)
+        finally:
+            stats[0] += 1
+            stats[1] += perf_counter_ns() - start
+
+    def compile(self):
+        node = self.node.compile()
+        stats = self.stats
+
+        def profiled(namespace):
+            start = perf_counter_ns()
+            try:
+                return node(namespace)
+            finally:
+                stats[0] += 1
+                stats[1] += perf_counter_ns() - start
+        return profiled
+
+
+class Profiler:
+    # Engines which run the tree's own visit or compile methods, so will
+    # execute the profiling wrappers as they are
+    ENGINES = ("compile", "walk")
+    MAX_WIDTH = 50
+
+    def __init__(self):
+        # (node, [count, total ns]) for every statement instrumented
+        self.entries = []
+
+    def instrument(self, node):
+        # Returns a copy of the tree with every assignment, if and while
+        # statement wrapped so that its executions are recorded. Programs
+        # that aren't instrumented pay nothing for profiling.
+        if isinstance(node, SuiteNode):
+            return SuiteNode([self.instrument(i) for i in node.statements])
+
+        if isinstance(node, IfNode):
+            node = IfNode(
+                node.condition, self.instrument(node.body),
+                None if node.else_body is None
+                else self.instrument(node.else_body),
+                node.location,
+            )
+        elif (
+            isinstance(node, WhileNode)
+            and not isinstance(node, InductionLoopNode)
+        ):
+            node = WhileNode(
+                node.condition, self.instrument(node.body), node.location
+            )
+        elif not isinstance(node, (AssignNode, InductionLoopNode)):
+            return node
+
+        stats = [0, 0]
+        self.entries.append((node, stats))
+        return ProfiledNode(node, stats)
+
+    def report(self, limit=20):
+        entries = sorted(
+            (i for i in self.entries if i[1][0]),
+            key=lambda entry: entry[1][1], reverse=True,
+        )
+        lines = [
+            f"{'line':>6}  {'count':>10}  {'total ms':>10}  "
+            f"{'per call us':>11}  statement"
+        ]
+        for node, (count, total) in entries[:limit]:
+            line = "?" if node.location is None else node.location[0] + 1
+            text = str(node)
+            if len(text) > self.MAX_WIDTH:
+                text = text[:self.MAX_WIDTH - 3] + "..."
+            lines.append(
+                f"{line:>6}  {count:>10}  {total / 1000000:>10.3f}  "
+                f"{total / count / 1000:>11.3f}  {text}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,284 @@
+from collections.abc import MutableMapping
+
+from .analysis import expressions, leading_assigns
+from .nodes import (
+    SuiteNode, IfNode, WhileNode, SkipNode, AssignNode, ConstantNode,
+    NotNode, _BinNode, AndNode, OrNode, VariableNode, InductionLoopNode
+)
+
+
+def resolve(ast):
+    # Gives every variable the program reads or assigns a slot, numbered in
+    # the order they first appear
+    slots = {}
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (VariableNode, AssignNode)):
+            slots.setdefault(node.name, len(slots))
+        stack.extend(reversed(node.children()))
+    return slots
+
+
+class SlotNamespace(MutableMapping):
+    # A namespace holding each resolved variable at a fixed index of a list,
+    # so compiled code reads and writes it without hashing its name. Which
+    # variables have been assigned, and in what order, is kept alongside, as
+    # a variable that was never assigned still has a slot holding 0. Names
+    # without a slot, such as those only assigned by code run with @eval,
+    # are kept in a dict. Directives see it as any other mapping.
+    __slots__ = ("regs", "present", "slots", "extra", "tick")
+
+    def __init__(self, slots, values=()):
+        self.regs = [0] * len(slots)
+        self.present = {}
+        self.slots = slots
+        self.extra = {}
+        self.tick = getattr(values, "tick", None)
+        self.update(values)
+
+    def __getitem__(self, name):
+        if name not in self.present:
+            raise KeyError(name)
+        slot = self.slots.get(name)
+        if slot is None:
+            return self.extra[name]
+        return self.regs[slot]
+
+    def get(self, name, default=None):
+        if name not in self.present:
+            return default
+        slot = self.slots.get(name)
+        if slot is None:
+            return self.extra[name]
+        return self.regs[slot]
+
+    def __setitem__(self, name, value):
+        slot = self.slots.get(name)
+        if slot is None:
+            self.extra[name] = value
+        else:
+            self.regs[slot] = value
+        if name not in self.present:
+            self.present[name] = None
+
+    def __delitem__(self, name):
+        del self.present[name]
+        slot = self.slots.get(name)
+        if slot is None:
+            del self.extra[name]
+        else:
+            self.regs[slot] = 0
+
+    def __iter__(self):
+        return iter(self.present)
+
+    def __len__(self):
+        return len(self.present)
+
+    def __contains__(self, name):
+        return name in self.present
+
+    def clear(self):
+        self.regs[:] = [0] * len(self.regs)
+        self.present.clear()
+        self.extra.clear()
+
+
+class SlotCompiler:
+    # Compiles a program into closures much as ASTNode.compile does, but
+    # against a SlotNamespace, with every variable resolved to its slot
+    # ahead of time. Anything other than assignments, control flow and
+    # arithmetic is run through the node's own compiled form, which sees the
+    # namespace as a mapping.
+    def __init__(self, slots):
+        self.slots = slots
+        # Variables known to be present in the namespace at this point, which
+        # needn't be recorded as present again when assigned
+        self._defined = set()
+
+    def _native(self, node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, NotNode):
+                stack.append(node.expr)
+            elif isinstance(node, _BinNode):
+                stack.append(node.lhs)
+                stack.append(node.rhs)
+            elif not isinstance(node, (ConstantNode, VariableNode)):
+                return False
+        return True
+
+    def expr(self, node):
+        if not self._native(node):
+            # May assign or clear anything
+            self._defined = set()
+            return node.compile()
+        return self._expr(node)
+
+    def _expr(self, node):
+        if isinstance(node, ConstantNode):
+            value = node.value
+            return lambda ns: value
+        if isinstance(node, VariableNode):
+            slot = self.slots[node.name]
+            return lambda ns: ns.regs[slot]
+        if isinstance(node, NotNode):
+            expr = self._expr(node.expr)
+            return lambda ns: not expr(ns)
+
+        lhs, rhs = node.lhs, node.rhs
+        if isinstance(node, AndNode):
+            lhs, rhs = self._expr(lhs), self._expr(rhs)
+            return lambda ns: lhs(ns) and rhs(ns)
+        if isinstance(node, OrNode):
+            lhs, rhs = self._expr(lhs), self._expr(rhs)
+            return lambda ns: lhs(ns) or rhs(ns)
+
+        op = node.function
+        if isinstance(lhs, VariableNode) and isinstance(rhs, ConstantNode):
+            slot, value = self.slots[lhs.name], rhs.value
+            return lambda ns: op(ns.regs[slot], value)
+        if isinstance(lhs, ConstantNode) and isinstance(rhs, VariableNode):
+            value, slot = lhs.value, self.slots[rhs.name]
+            return lambda ns: op(value, ns.regs[slot])
+        if isinstance(lhs, VariableNode) and isinstance(rhs, VariableNode):
+            lslot, rslot = self.slots[lhs.name], self.slots[rhs.name]
+
+            def binary(ns):
+                regs = ns.regs
+                return op(regs[lslot], regs[rslot])
+            return binary
+
+        lhs, rhs = self._expr(lhs), self._expr(rhs)
+        return lambda ns: op(lhs(ns), rhs(ns))
+
+    def statement(self, node):
+        if isinstance(node, SuiteNode):
+            statements = [self.statement(i) for i in node.statements]
+            if len(statements) == 0:
+                return lambda ns: 0
+            if len(statements) == 1:
+                return statements[0]
+            *body, last = statements
+
+            def suite(ns):
+                for i in body:
+                    i(ns)
+                return last(ns)
+            return suite
+
+        if isinstance(node, SkipNode):
+            return lambda ns: None
+        if isinstance(node, AssignNode):
+            return self._assign(node)
+        if isinstance(node, IfNode):
+            return self._if(node)
+        if (
+            isinstance(node, WhileNode)
+            and not isinstance(node, InductionLoopNode)
+        ):
+            return self._while(node)
+        return self.expr(node)
+
+    def _assign(self, node):
+        name = node.name
+        slot = self.slots[name]
+        value = self.expr(node.value)
+        if name in self._defined:
+            def assign(ns):
+                ns.regs[slot] = value(ns)
+            return assign
+
+        self._defined.add(name)
+
+        def assign_new(ns):
+            ns.regs[slot] = value(ns)
+            if name not in ns.present:
+                ns.present[name] = None
+        return assign_new
+
+    def _if(self, node):
+        condition = self.expr(node.condition)
+        defined = self._defined
+        self._defined = set(defined)
+        body = self.statement(node.body)
+        after = self._defined
+        self._defined = set(defined)
+        if node.else_body is None:
+            self._defined &= after
+
+            def if_(ns):
+                if condition(ns):
+                    body(ns)
+            return if_
+
+        else_body = self.statement(node.else_body)
+        self._defined &= after
+
+        def if_else(ns):
+            if condition(ns):
+                body(ns)
+            else:
+                else_body(ns)
+        return if_else
+
+    def _while(self, node):
+        # As in the VM, the presence of anything the body always assigns is
+        # recorded once on entry rather than on every iteration
+        defined = self._defined
+        calls = not all(map(self._native, expressions(node)))
+
+        condition = self.expr(node.condition)
+        self._defined = set() if calls else set(defined)
+        marks = []
+        if not calls:
+            marks = [
+                name for name in leading_assigns(node.body)
+                if name not in self._defined
+            ]
+            self._defined.update(marks)
+        body = self.statement(node.body)
+        self._defined = set() if calls else defined
+
+        def while_(ns):
+            if not condition(ns):
+                return
+            present = ns.present
+            for name in marks:
+                if name not in present:
+                    present[name] = None
+            tick = ns.tick
+            if tick is None:
+                while True:
+                    body(ns)
+                    if not condition(ns):
+                        break
+            else:
+                while True:
+                    body(ns)
+                    tick()
+                    if not condition(ns):
+                        break
+        return while_
+
+
+class SlotProgram:
+    def __init__(self, ast):
+        self.slots = resolve(ast)
+        self._body = SlotCompiler(self.slots).statement(ast)
+
+    def __call__(self, namespace):
+        ns = SlotNamespace(self.slots, namespace)
+        try:
+            return self._body(ns)
+        finally:
+            # Leave the namespace as the program left it, in the order its
+            # variables were assigned
+            namespace.clear()
+            namespace.update(ns)
+
+
+def compile_slots(ast):
+    return SlotProgram(ast)
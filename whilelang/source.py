@@ -0,0 +1,49 @@
+class Source:
+    # Source text along with an index of where each line starts, which is
+    # only built the first time a line needs to be looked up
+    def __init__(self, text):
+        self.text = text
+        self._line_starts = None
+
+    @property
+    def line_starts(self):
+        if self._line_starts is None:
+            starts = [0]
+            find = self.text.find
+            index = find("\n")
+            while index != -1:
+                starts.append(index + 1)
+                index = find("\n", index + 1)
+            self._line_starts = starts
+        return self._line_starts
+
+    def __len__(self):
+        return len(self.text)
+
+    def line(self, number):
+        starts = self.line_starts
+        if number >= len(starts):
+            return ""
+        if number + 1 < len(starts):
+            return self.text[starts[number]:starts[number + 1] - 1]
+        return self.text[starts[number]:]
+
+
+class StreamSource:
+    # Stands in for Source when a file is lexed as it's read, and so is
+    # never held in memory all at once. Lines are only needed to report
+    # syntax errors, so are read back from the file when asked for.
+    def __init__(self, path):
+        self.path = path
+
+    def line(self, number):
+        if not isinstance(self.path, str):
+            return ""
+        try:
+            with open(self.path) as file_:
+                for n, line in enumerate(file_):
+                    if n == number:
+                        return line.rstrip("\n")
+        except (OSError, UnicodeDecodeError):
+            pass
+        return ""
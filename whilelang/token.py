@@ -1,28 +1,14 @@
 class Token:
-    def __init__(self, type_, meta, location, length):
-        self._type = type_
-        self._meta = meta
-        self._location = location
-        self._length = length
-
-    @property
-    def type(self):
-        return self._type
-
-    @property
-    def location(self):
-        return self._location
+    __slots__ = ("type", "meta", "location", "length")
 
-    @property
-    def length(self):
-        return self._length
-
-    @property
-    def meta(self):
-        return self._meta
+    def __init__(self, type_, meta, location, length):
+        self.type = type_
+        self.meta = meta
+        self.location = location
+        self.length = length
 
     def __str__(self):
-        return f"Token: {self._type} ({self._meta})"
+        return f"Token: {self.type} ({self.meta})"
 
     def __repr__(self):
         return f"<{self} at {id(self):#016x}>"
@@ -0,0 +1,262 @@
+from .analysis import expressions, leading_assigns
+from .nodes import (
+    SuiteNode, IfNode, WhileNode, SkipNode, AssignNode, ConstantNode,
+    NotNode, _BinNode, AndNode, OrNode, CmpNode, VariableNode,
+    InductionLoopNode
+)
+
+
+class Transpiler:
+    INDENT = "    "
+    # Constants larger than this are passed in as globals rather than
+    # written out as literals, as int -> str conversion is limited.
+    MAX_LITERAL = 10 ** 100
+
+    def __init__(self, ast):
+        self._ast = ast
+        self._lines = []
+        self._depth = 1
+        self._globals = {}
+        self._temps = 0
+        # Variables known to be present in the namespace at this point, which
+        # needn't be inserted into it again when assigned
+        self._defined = set()
+
+        self._read = set()
+        self._assigned = set()
+        self._collect(ast)
+
+    def _collect(self, node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, SuiteNode):
+                stack.extend(node.statements)
+            elif isinstance(node, IfNode):
+                stack.append(node.condition)
+                stack.append(node.body)
+                if node.else_body is not None:
+                    stack.append(node.else_body)
+            elif isinstance(node, WhileNode):
+                stack.append(node.condition)
+                stack.append(node.body)
+            elif isinstance(node, AssignNode):
+                self._assigned.add(node.name)
+                stack.append(node.value)
+            elif isinstance(node, NotNode):
+                stack.append(node.expr)
+            elif isinstance(node, _BinNode):
+                stack.append(node.lhs)
+                stack.append(node.rhs)
+            elif isinstance(node, VariableNode):
+                self._read.add(node.name)
+
+    @staticmethod
+    def _var(name):
+        return f"v_{name}"
+
+    def _emit(self, line):
+        self._lines.append(self.INDENT * self._depth + line)
+
+    def _global(self, value):
+        name = f"_g{len(self._globals)}"
+        self._globals[name] = value
+        return name
+
+    def _temp(self):
+        self._temps += 1
+        return f"_t{self._temps}"
+
+    def _native(self, node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, NotNode):
+                stack.append(node.expr)
+            elif isinstance(node, _BinNode):
+                if (
+                    isinstance(node, CmpNode)
+                    and node.mode not in CmpNode.OPERATORS
+                ):
+                    return False
+                stack.append(node.lhs)
+                stack.append(node.rhs)
+            elif not isinstance(node, (ConstantNode, VariableNode)):
+                return False
+        return True
+
+    def _load(self):
+        for name in sorted(self._read | self._assigned):
+            self._emit(f"{self._var(name)} = namespace.get({name!r}, 0)")
+
+    def _store(self):
+        # Whether a variable has been assigned is tracked by its presence in
+        # the namespace, which also keeps the namespace in assignment order
+        for name in sorted(self._assigned):
+            self._emit(f"if {name!r} in namespace:")
+            self._emit(f"{self.INDENT}namespace[{name!r}] = {self._var(name)}")
+
+    def _define(self, name):
+        if name not in self._defined:
+            self._emit(f"if {name!r} not in namespace:")
+            self._emit(f"{self.INDENT}namespace[{name!r}] = 0")
+            self._defined.add(name)
+
+    def _fallback(self, node):
+        # Anything we can't express natively runs through its compiled form
+        # against the real namespace, so locals are synced around it.
+        func = self._global(node.compile())
+        temp = self._temp()
+        self._store()
+        self._emit(f"{temp} = {func}(namespace)")
+        self._load()
+        self._defined = set()
+        return temp
+
+    def expr(self, node):
+        if not self._native(node):
+            return self._fallback(node)
+        return self._expr(node)
+
+    def _expr(self, node):
+        if isinstance(node, ConstantNode):
+            value = node.value
+            if isinstance(value, int) and abs(value) >= self.MAX_LITERAL:
+                return self._global(value)
+            return repr(value)
+        if isinstance(node, VariableNode):
+            return self._var(node.name)
+        if isinstance(node, NotNode):
+            return f"(not {self._expr(node.expr)})"
+        if isinstance(node, AndNode):
+            return f"({self._expr(node.lhs)} and {self._expr(node.rhs)})"
+        if isinstance(node, OrNode):
+            return f"({self._expr(node.lhs)} or {self._expr(node.rhs)})"
+        if isinstance(node, CmpNode):
+            op = node.mode
+        else:
+            op = "==" if node.op == "=" else node.op
+        return f"({self._expr(node.lhs)} {op} {self._expr(node.rhs)})"
+
+    def statement(self, node, last=False):
+        if isinstance(node, SuiteNode):
+            if not node.statements:
+                if last:
+                    self._emit("return 0")
+                return
+            for i in node.statements[:-1]:
+                self.statement(i)
+            self.statement(node.statements[-1], last)
+            return
+
+        if isinstance(node, SkipNode):
+            pass
+        elif isinstance(node, AssignNode):
+            value = self.expr(node.value)
+            self._emit(f"{self._var(node.name)} = {value}")
+            self._define(node.name)
+        elif isinstance(node, IfNode):
+            condition = self.expr(node.condition)
+            self._emit(f"if {condition}:")
+            defined = self._defined
+            self._defined = set(defined)
+            self._block(node.body)
+            after = self._defined
+            self._defined = set(defined)
+            if node.else_body is not None:
+                self._emit("else:")
+                self._block(node.else_body)
+            self._defined &= after
+        elif (
+            isinstance(node, WhileNode)
+            and not isinstance(node, InductionLoopNode)
+        ):
+            # The body may run any number of times, so only what was present
+            # before the loop is known inside it, or after it if the body
+            # could have reset the namespace
+            defined = self._defined
+            if all(map(self._native, expressions(node))):
+                # Nothing can observe the namespace mid-loop, so variables
+                # the body always assigns are inserted once up front
+                condition = self._expr(node.condition)
+                self._defined = set(defined)
+                names = [
+                    i for i in leading_assigns(node.body) if i not in defined
+                ]
+                if names:
+                    self._emit(f"if {condition}:")
+                    self._depth += 1
+                    for name in names:
+                        self._define(name)
+                    self._depth -= 1
+                self._emit(f"while {condition}:")
+                self._depth += 1
+                self.statement(node.body)
+                self._tick()
+                self._depth -= 1
+                self._defined = defined
+            else:
+                self._defined = set()
+                self._emit("while True:")
+                self._depth += 1
+                self._emit(f"if not {self.expr(node.condition)}:")
+                self._emit(f"{self.INDENT}break")
+                self.statement(node.body)
+                self._tick()
+                self._depth -= 1
+                self._defined = set()
+        else:
+            value = self.expr(node)
+            if last:
+                self._emit(f"return {value}")
+            else:
+                self._emit(value)
+            return
+
+        if last:
+            self._emit("return None")
+
+    def _tick(self):
+        # Loop back-edges count against the namespace's step limit, if any
+        self._emit("if _tick is not None:")
+        self._emit(f"{self.INDENT}_tick()")
+
+    def _block(self, node):
+        self._depth += 1
+        self.statement(node)
+        self._emit("pass")
+        self._depth -= 1
+
+    def source(self):
+        self._emit('_tick = getattr(namespace, "tick", None)')
+        self._load()
+        self._emit("try:")
+        self._depth += 1
+        self.statement(self._ast, last=True)
+        self._depth -= 1
+        self._emit("finally:")
+        self._depth += 1
+        self._store()
+        self._emit("pass")
+        self._depth -= 1
+
+        return "\n".join(["def _program(namespace):"] + self._lines) + "\n"
+
+    def compile(self):
+        source = self.source()
+        scope = dict(self._globals)
+        exec(compile(source, "<while>", "exec"), scope)
+        return scope["_program"]
+
+
+def transpile(ast):
+    return Transpiler(ast).source()
+
+
+def compile_python(ast):
+    try:
+        return Transpiler(ast).compile()
+    except (SyntaxError, RecursionError, MemoryError):
+        # CPython limits how deeply blocks and expressions may nest, so
+        # very deep programs use the closure compiler instead
+        return ast.compile()
@@ -1,16 +1,16 @@
 def phi(n, m):
-    return (2 ** n) * (2 * m + 1) - 1
+    if n < 0:
+        return (2 ** n) * (2 * m + 1) - 1
+    return ((2 * m + 1) << n) - 1
 
 
 def phi_prime(x):
-    n = 0
     m = int(x) + 1
-    while m % 2 == 0 and m > 0:
-        n += 1
-        m >>= 1
-    m = (m - 1) // 2
-
-    return n, m
+    if m <= 0:
+        return 0, (m - 1) // 2
+    # The number of trailing zero bits, which for an odd m + 1 is zero
+    n = (m & -m).bit_length() - 1
+    return n, m >> (n + 1)
 
 
 def beta(x):
@@ -0,0 +1,305 @@
+import operator
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .errors import (
+    WhileError, WhileStepLimitError, WhileTimeoutError, WhileSystemExit
+)
+from .nodes import (
+    SuiteNode, IfNode, WhileNode, SkipNode, AssignNode, ConstantNode,
+    NotNode, MulNode, AddNode, SubNode, EqNode, AndNode, OrNode, CmpNode,
+    VariableNode, InductionLoopNode
+)
+
+VECTOR_NODES = (
+    SuiteNode, IfNode, WhileNode, SkipNode, AssignNode, ConstantNode,
+    NotNode, MulNode, AddNode, SubNode, EqNode, AndNode, OrNode, CmpNode,
+    VariableNode
+)
+# Results at least this large no longer fit in an int64, so arithmetic that
+# could reach it is done on arrays of Python ints instead
+INT64_LIMIT = 2 ** 63
+
+
+class _Fallback(Exception):
+    pass
+
+
+def vectorisable(ast):
+    # Only integer and boolean arithmetic over variables can be run across
+    # lanes. Directives print, or act on the whole namespace, so programs
+    # using them run one namespace at a time. Loops that -O2 runs in closed
+    # form would lose that here by being stepped through, so they do too.
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, VECTOR_NODES):
+            return False
+        if isinstance(node, InductionLoopNode):
+            return False
+        if isinstance(node, ConstantNode) and type(node.value) not in (
+            int, bool
+        ):
+            return False
+        stack.extend(node.children())
+    return True
+
+
+def _int_array(values):
+    array = numpy.array(values, dtype=object)
+    if all(-INT64_LIMIT < i < INT64_LIMIT for i in values):
+        return array.astype(numpy.int64)
+    return array
+
+
+def _unify(lhs, rhs):
+    if lhs.dtype == object or rhs.dtype == object:
+        return lhs.astype(object), rhs.astype(object)
+    return lhs, rhs
+
+
+def _bound(array):
+    return int(numpy.abs(array).max())
+
+
+class _Lanes:
+    # Runs a program over many namespaces at once. Each variable is an array
+    # with one value per namespace (lane), alongside an array marking which
+    # lanes hold a boolean rather than an integer, as True and 1 behave the
+    # same in every operation but must come back out as what they were.
+    # Statements are run under a mask of the lanes they apply to, and loops
+    # repeat until the condition is false in every lane.
+    def __init__(self, namespaces, max_steps=None, timeout=None):
+        self.size = len(namespaces)
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self._deadline = None
+        if timeout is not None:
+            self._deadline = time.monotonic() + timeout
+
+        self.values = {}
+        self.bools = {}
+        # Lanes a variable is present in, and when each was first assigned
+        # it, so each namespace comes back out in assignment order
+        self.defined = {}
+        self.order = {}
+        self._clock = 0
+        self._constants = {}
+
+        self.alive = numpy.ones(self.size, dtype=bool)
+        self.steps = numpy.zeros(self.size, dtype=numpy.int64)
+        self.errors = [None] * self.size
+
+        names = {}
+        for namespace in namespaces:
+            names.update(dict.fromkeys(namespace))
+        for name in names:
+            values = []
+            for namespace in namespaces:
+                value = namespace.get(name, 0)
+                if type(value) not in (int, bool):
+                    raise _Fallback()
+                values.append(int(value))
+            self.values[name] = _int_array(values)
+            self.bools[name] = numpy.array([
+                type(namespace.get(name, 0)) is bool
+                for namespace in namespaces
+            ])
+            self.defined[name] = numpy.array([
+                name in namespace for namespace in namespaces
+            ])
+            # Initial variables come before anything assigned, in the order
+            # they were given
+            self.order[name] = numpy.array([
+                list(namespace).index(name) - len(namespace)
+                if name in namespace else 0
+                for namespace in namespaces
+            ], dtype=numpy.int64)
+
+    def _full(self, value):
+        return _int_array([int(value)] * self.size)
+
+    def expr(self, node):
+        if isinstance(node, ConstantNode):
+            # Keyed by type as well, as true and 1 compare equal
+            key = (type(node.value), node.value)
+            if key not in self._constants:
+                self._constants[key] = (
+                    self._full(node.value),
+                    numpy.full(self.size, type(node.value) is bool),
+                )
+            return self._constants[key]
+        if isinstance(node, VariableNode):
+            if node.name not in self.values:
+                return self._full(0), numpy.zeros(self.size, dtype=bool)
+            return self.values[node.name], self.bools[node.name]
+        if isinstance(node, NotNode):
+            value, _ = self.expr(node.expr)
+            return (
+                (value == 0).astype(numpy.int64),
+                numpy.ones(self.size, dtype=bool),
+            )
+
+        lhs, lhs_bools = self.expr(node.lhs)
+        rhs, rhs_bools = self.expr(node.rhs)
+        lhs, rhs = _unify(lhs, rhs)
+        if isinstance(node, (AndNode, OrNode)):
+            # Both evaluate to one of their operands, which for & is the
+            # rhs where the lhs is truthy, and for | where it isn't
+            choose = lhs != 0
+            if isinstance(node, OrNode):
+                choose = ~choose
+            return (
+                numpy.where(choose, rhs, lhs),
+                numpy.where(choose, rhs_bools, lhs_bools),
+            )
+        if isinstance(node, (EqNode, CmpNode)):
+            if isinstance(node, EqNode):
+                function = operator.eq
+            else:
+                function = CmpNode.OPERATORS.get(node.mode)
+            if function is None:
+                result = numpy.zeros(self.size, dtype=numpy.int64)
+            else:
+                result = function(lhs, rhs).astype(numpy.int64)
+            return result, numpy.ones(self.size, dtype=bool)
+
+        function = node.function
+        if lhs.dtype != object:
+            if isinstance(node, MulNode):
+                bound = _bound(lhs) * _bound(rhs)
+            else:
+                bound = _bound(lhs) + _bound(rhs)
+            if bound >= INT64_LIMIT:
+                lhs, rhs = lhs.astype(object), rhs.astype(object)
+        return function(lhs, rhs), numpy.zeros(self.size, dtype=bool)
+
+    def _truthy(self, node):
+        value, _ = self.expr(node)
+        return value != 0
+
+    def statement(self, node, mask):
+        mask = mask & self.alive
+        if not mask.any():
+            return
+
+        if isinstance(node, SuiteNode):
+            for i in node.statements:
+                self.statement(i, mask)
+        elif isinstance(node, AssignNode):
+            self._assign(node.name, self.expr(node.value), mask)
+        elif isinstance(node, IfNode):
+            condition = self._truthy(node.condition)
+            self.statement(node.body, mask & condition)
+            if node.else_body is not None:
+                self.statement(node.else_body, mask & ~condition)
+        elif isinstance(node, WhileNode):
+            while True:
+                mask = mask & self._truthy(node.condition)
+                if not mask.any():
+                    break
+                self.statement(node.body, mask)
+                mask = mask & self.alive
+                self._tick(mask)
+                mask = mask & self.alive
+
+    def _assign(self, name, result, mask):
+        value, bools = result
+        if name not in self.values:
+            self.values[name] = self._full(0)
+            self.bools[name] = numpy.zeros(self.size, dtype=bool)
+            self.defined[name] = numpy.zeros(self.size, dtype=bool)
+            self.order[name] = numpy.zeros(self.size, dtype=numpy.int64)
+
+        old, value = _unify(self.values[name], value)
+        self.values[name] = numpy.where(mask, value, old)
+        self.bools[name] = numpy.where(mask, bools, self.bools[name])
+
+        new = mask & ~self.defined[name]
+        if new.any():
+            self.order[name][new] = self._clock
+            self.defined[name] |= new
+        self._clock += 1
+
+    def _tick(self, mask):
+        # Lanes that go over a limit stop where they are, as they would had
+        # they been run alone
+        self.steps[mask] += 1
+        if self.max_steps is not None:
+            over = mask & (self.steps > self.max_steps)
+            for lane in numpy.flatnonzero(over):
+                self.errors[lane] = WhileStepLimitError(
+                    f"Step limit of {self.max_steps} exceeded"
+                )
+            self.alive &= ~over
+        if self._deadline is not None and time.monotonic() > self._deadline:
+            for lane in numpy.flatnonzero(self.alive):
+                self.errors[lane] = WhileTimeoutError(
+                    f"Timed out after {self.timeout}s"
+                )
+            self.alive[:] = False
+
+    def store(self, namespaces):
+        for lane, namespace in enumerate(namespaces):
+            names = sorted(
+                (self.order[name][lane], name)
+                for name in self.values if self.defined[name][lane]
+            )
+            namespace.clear()
+            for _, name in names:
+                value = self.values[name][lane]
+                if self.bools[name][lane]:
+                    namespace[name] = bool(value)
+                else:
+                    namespace[name] = int(value)
+            error = self.errors[lane]
+            if error is not None:
+                error.namespace = namespace
+
+
+class VectorProgram:
+    # Runs a program against many namespaces at once using NumPy, falling
+    # back to running the scalar program against each in turn when NumPy
+    # isn't installed, or the program or its inputs can't be vectorised.
+    def __init__(self, ast, fallback):
+        self._ast = ast
+        self._fallback = fallback
+        self.vectorised = numpy is not None and vectorisable(ast)
+
+    def __call__(self, namespaces, max_steps=None, timeout=None):
+        # Runs the program against every namespace, in place, and returns
+        # the error each raised, or None
+        if self.vectorised and namespaces:
+            try:
+                lanes = _Lanes(namespaces, max_steps, timeout)
+            except _Fallback:
+                pass
+            else:
+                lanes.statement(self._ast, lanes.alive)
+                lanes.store(namespaces)
+                return lanes.errors
+        return [
+            self._scalar(namespace, max_steps, timeout)
+            for namespace in namespaces
+        ]
+
+    def _scalar(self, namespace, max_steps, timeout):
+        from .main import execute
+
+        try:
+            execute(self._fallback, namespace, max_steps, timeout)
+        except WhileSystemExit:
+            pass
+        except (WhileError, Exception) as e:
+            return e
+        return None
+
+
+def compile_vector(ast, fallback=None):
+    if fallback is None:
+        fallback = ast.compile()
+    return VectorProgram(ast, fallback)
@@ -0,0 +1,527 @@
+from array import array
+import operator
+
+from .analysis import evaluated, leading_assigns, statements
+from .nodes import (
+    SuiteNode, IfNode, WhileNode, SkipNode, AssignNode, ConstantNode,
+    NotNode, _BinNode, AndNode, OrNode, CmpNode, VariableNode, MulNode,
+    DivNode, AddNode, SubNode, EqNode, InductionLoopNode
+)
+
+
+(
+    MOVE, ADD, SUB, MUL, DIV, EQ, GT, GE, LT, LE, NOT,
+    JUMP, JUMP_IF_FALSE, JUMP_IF_TRUE, MARK, CALL, HALT,
+    JUMP_IF_GT, JUMP_IF_GE, JUMP_IF_LT, JUMP_IF_LE,
+) = range(21)
+# Added to the opcode of a loop's back-edge jump when the namespace has a
+# step limit, so that only then does the VM stop to count iterations
+TICKED = 32
+
+OPCODES = {
+    MOVE: ("MOVE", 2), ADD: ("ADD", 3), SUB: ("SUB", 3), MUL: ("MUL", 3),
+    DIV: ("DIV", 3), EQ: ("EQ", 3), GT: ("GT", 3), GE: ("GE", 3),
+    LT: ("LT", 3), LE: ("LE", 3), NOT: ("NOT", 2), JUMP: ("JUMP", 1),
+    JUMP_IF_FALSE: ("JUMP_IF_FALSE", 2), JUMP_IF_TRUE: ("JUMP_IF_TRUE", 2),
+    MARK: ("MARK", 1), CALL: ("CALL", 2), HALT: ("HALT", 0),
+    JUMP_IF_GT: ("JUMP_IF_GT", 3), JUMP_IF_GE: ("JUMP_IF_GE", 3),
+    JUMP_IF_LT: ("JUMP_IF_LT", 3), JUMP_IF_LE: ("JUMP_IF_LE", 3),
+}
+
+BIN_OPCODES = {
+    AddNode: ADD, SubNode: SUB, MulNode: MUL, DivNode: DIV, EqNode: EQ,
+}
+CMP_OPCODES = {">": GT, ">=": GE, "<": LT, "<=": LE}
+CMP_JUMP_OPCODES = {
+    ">": JUMP_IF_GT, ">=": JUMP_IF_GE, "<": JUMP_IF_LT, "<=": JUMP_IF_LE,
+}
+JUMP_COMPARISONS = {
+    JUMP_IF_GT: operator.gt, JUMP_IF_GE: operator.ge,
+    JUMP_IF_LT: operator.lt, JUMP_IF_LE: operator.le,
+}
+
+
+class Program:
+    def __init__(self, code, registers, names, calls, result, back_edges):
+        # Instructions are an opcode followed by its operands, all of which
+        # are register indices or jump targets.
+        self.code = code
+        # Initial register file. Variables come first, then constants, then
+        # temporaries.
+        self.registers = registers
+        self.names = names
+        self.calls = calls
+        self.result = result
+        # Positions of the jumps that close each loop
+        self.back_edges = back_edges
+        self._ticked_code = None
+
+    def disassemble(self):
+        lines = []
+        pc = 0
+        while pc < len(self.code):
+            name, width = OPCODES[self.code[pc] % TICKED]
+            operands = ", ".join(
+                str(i) for i in self.code[pc + 1:pc + 1 + width]
+            )
+            lines.append(f"{pc:>6} {name:<14}{operands}")
+            pc += width + 1
+        return "\n".join(lines)
+
+    def _load(self, namespace, regs):
+        for n, name in enumerate(self.names):
+            regs[n] = namespace.get(name, 0)
+
+    def _store(self, namespace, regs):
+        # Whether a variable has been assigned is tracked by its presence in
+        # the namespace, which also keeps the namespace in assignment order
+        for n, name in enumerate(self.names):
+            if name in namespace:
+                namespace[name] = regs[n]
+
+    def __call__(self, namespace):
+        # Executing from a list rather than the array avoids boxing a fresh
+        # int for every operand fetch
+        tick = getattr(namespace, "tick", None)
+        if tick is None:
+            code = self.code.tolist()
+        else:
+            if self._ticked_code is None:
+                self._ticked_code = self.code.tolist()
+                for pc in self.back_edges:
+                    self._ticked_code[pc] += TICKED
+            code = self._ticked_code
+        regs = list(self.registers)
+        names = self.names
+        calls = self.calls
+
+        self._load(namespace, regs)
+        pc = 0
+        try:
+            while True:
+                op = code[pc]
+                if op == JUMP_IF_GT:
+                    if regs[code[pc + 1]] > regs[code[pc + 2]]:
+                        pc = code[pc + 3]
+                    else:
+                        pc += 4
+                elif op == JUMP_IF_LT:
+                    if regs[code[pc + 1]] < regs[code[pc + 2]]:
+                        pc = code[pc + 3]
+                    else:
+                        pc += 4
+                elif op == JUMP_IF_FALSE:
+                    if regs[code[pc + 1]]:
+                        pc += 3
+                    else:
+                        pc = code[pc + 2]
+                elif op == ADD:
+                    regs[code[pc + 1]] = (
+                        regs[code[pc + 2]] + regs[code[pc + 3]]
+                    )
+                    pc += 4
+                elif op == SUB:
+                    regs[code[pc + 1]] = (
+                        regs[code[pc + 2]] - regs[code[pc + 3]]
+                    )
+                    pc += 4
+                elif op == JUMP:
+                    pc = code[pc + 1]
+                elif op == JUMP_IF_GE:
+                    if regs[code[pc + 1]] >= regs[code[pc + 2]]:
+                        pc = code[pc + 3]
+                    else:
+                        pc += 4
+                elif op == JUMP_IF_LE:
+                    if regs[code[pc + 1]] <= regs[code[pc + 2]]:
+                        pc = code[pc + 3]
+                    else:
+                        pc += 4
+                elif op == GT:
+                    regs[code[pc + 1]] = (
+                        regs[code[pc + 2]] > regs[code[pc + 3]]
+                    )
+                    pc += 4
+                elif op == LT:
+                    regs[code[pc + 1]] = (
+                        regs[code[pc + 2]] < regs[code[pc + 3]]
+                    )
+                    pc += 4
+                elif op == GE:
+                    regs[code[pc + 1]] = (
+                        regs[code[pc + 2]] >= regs[code[pc + 3]]
+                    )
+                    pc += 4
+                elif op == LE:
+                    regs[code[pc + 1]] = (
+                        regs[code[pc + 2]] <= regs[code[pc + 3]]
+                    )
+                    pc += 4
+                elif op == EQ:
+                    regs[code[pc + 1]] = (
+                        regs[code[pc + 2]] == regs[code[pc + 3]]
+                    )
+                    pc += 4
+                elif op == MUL:
+                    regs[code[pc + 1]] = (
+                        regs[code[pc + 2]] * regs[code[pc + 3]]
+                    )
+                    pc += 4
+                elif op == MOVE:
+                    regs[code[pc + 1]] = regs[code[pc + 2]]
+                    pc += 3
+                elif op == JUMP_IF_TRUE:
+                    if regs[code[pc + 1]]:
+                        pc = code[pc + 2]
+                    else:
+                        pc += 3
+                elif op == NOT:
+                    regs[code[pc + 1]] = not regs[code[pc + 2]]
+                    pc += 3
+                elif op == MARK:
+                    if names[code[pc + 1]] not in namespace:
+                        namespace[names[code[pc + 1]]] = 0
+                    pc += 2
+                elif op == DIV:
+                    regs[code[pc + 1]] = (
+                        regs[code[pc + 2]] / regs[code[pc + 3]]
+                    )
+                    pc += 4
+                elif op == CALL:
+                    self._store(namespace, regs)
+                    ret = calls[code[pc + 2]](namespace)
+                    self._load(namespace, regs)
+                    regs[code[pc + 1]] = ret
+                    pc += 3
+                elif op == HALT:
+                    return regs[self.result]
+                else:
+                    tick()
+                    op -= TICKED
+                    if op == JUMP_IF_TRUE:
+                        taken = regs[code[pc + 1]]
+                        target = code[pc + 2]
+                    else:
+                        taken = JUMP_COMPARISONS[op](
+                            regs[code[pc + 1]], regs[code[pc + 2]]
+                        )
+                        target = code[pc + 3]
+                    pc = target if taken else pc + OPCODES[op][1] + 1
+        finally:
+            self._store(namespace, regs)
+
+
+class Compiler:
+    def __init__(self):
+        self._code = array("q")
+        self._names = {}
+        self._constants = {}
+        self._constant_values = []
+        self._calls = []
+        self._temps = 0
+        self._max_temps = 0
+        # Variables known to be present in the namespace at this point, which
+        # needn't be inserted into it again when assigned
+        self._defined = set()
+
+        # Registers are numbered before the layout is known, so variables,
+        # constants and temporaries each get their own tagged space that is
+        # flattened once compilation finishes.
+        self._fixups = []
+        self._back_edges = []
+        # Ids of statements which evaluate an expression that has to be
+        # called out to, either themselves or within a nested statement
+        self._calling = set()
+
+    def _emit(self, op, *operands):
+        self._code.append(op)
+        self._code.extend(operands)
+
+    def _label(self):
+        return len(self._code)
+
+    def _emit_jump(self, op, *operands):
+        self._emit(op, *operands, -1)
+        return len(self._code) - 1
+
+    def _patch(self, slot, target=None):
+        self._code[slot] = self._label() if target is None else target
+
+    def _variable(self, name):
+        if name not in self._names:
+            self._names[name] = len(self._names)
+        return ("v", self._names[name])
+
+    def _constant(self, value):
+        key = (type(value), value)
+        if key not in self._constants:
+            self._constants[key] = len(self._constant_values)
+            self._constant_values.append(value)
+        return ("c", self._constants[key])
+
+    def _temp(self):
+        self._temps += 1
+        self._max_temps = max(self._max_temps, self._temps)
+        return ("t", self._temps - 1)
+
+    def _op(self, op, *regs):
+        start = len(self._code)
+        self._code.append(op)
+        for n, reg in enumerate(regs):
+            self._fixups.append((start + 1 + n, reg))
+            self._code.append(0)
+
+    def _jump(self, op, *regs):
+        self._op(op, *regs)
+        self._code.append(-1)
+        return len(self._code) - 1
+
+    def _call(self, node, dst):
+        self._calls.append(node.compile())
+        self._op(CALL, dst)
+        self._code.append(len(self._calls) - 1)
+        self._defined = set()
+
+    def _native(self, node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, NotNode):
+                stack.append(node.expr)
+            elif isinstance(node, _BinNode):
+                if isinstance(node, CmpNode):
+                    if node.mode not in CMP_OPCODES:
+                        return False
+                elif not isinstance(node, (AndNode, OrNode)) and (
+                    type(node) not in BIN_OPCODES
+                ):
+                    return False
+                stack.append(node.lhs)
+                stack.append(node.rhs)
+            elif not isinstance(node, (ConstantNode, VariableNode)):
+                return False
+        return True
+
+    def expr(self, node, dst=None):
+        # Lowered over an explicit stack of work rather than by recursing, so
+        # that expressions of any depth can be compiled. Each item either
+        # visits a node, or finishes one whose operands have been visited,
+        # and leaves the register holding its value on values.
+        values = []
+        work = [(self._visit_expr, node, dst, False)]
+        while work:
+            function, *args = work.pop()
+            function(work, values, *args)
+        return values.pop()
+
+    def _visit_expr(self, work, values, node, dst, native):
+        # Everything within a native expression is native too, so it's only
+        # checked for once per expression rather than at every level
+        if isinstance(node, ConstantNode):
+            values.append(self._constant(node.value))
+        elif isinstance(node, VariableNode):
+            values.append(self._variable(node.name))
+        elif not native and not self._native(node):
+            dst = dst or self._temp()
+            self._call(node, dst)
+            values.append(dst)
+        elif isinstance(node, (AndNode, OrNode)):
+            # Short-circuiting writes the lhs into the destination before
+            # the rhs is evaluated, so never target a variable directly
+            work.append((self._short_circuit, node, self._temp()))
+            work.append((self._visit_expr, node.lhs, None, True))
+        elif isinstance(node, NotNode):
+            work.append((self._finish_op, NOT, 1, dst))
+            work.append((self._visit_expr, node.expr, None, True))
+        else:
+            if isinstance(node, CmpNode):
+                op = CMP_OPCODES[node.mode]
+            else:
+                op = BIN_OPCODES[type(node)]
+            work.append((self._finish_op, op, 2, dst))
+            work.append((self._visit_expr, node.rhs, None, True))
+            work.append((self._visit_expr, node.lhs, None, True))
+
+    def _short_circuit(self, work, values, node, out):
+        self._op(MOVE, out, values.pop())
+        slot = self._jump(
+            JUMP_IF_FALSE if isinstance(node, AndNode) else JUMP_IF_TRUE, out
+        )
+        work.append((self._finish_short_circuit, out, slot))
+        work.append((self._visit_expr, node.rhs, None, True))
+
+    def _finish_short_circuit(self, work, values, out, slot):
+        self._op(MOVE, out, values.pop())
+        self._patch(slot)
+        values.append(out)
+
+    def _finish_op(self, work, values, op, arity, dst):
+        operands = values[-arity:]
+        del values[-arity:]
+        dst = dst or self._temp()
+        self._op(op, dst, *operands)
+        values.append(dst)
+
+    def statement(self, node, result=None):
+        # As with expressions, statements are lowered over an explicit stack
+        # so that deeply nested programs don't exhaust Python's recursion
+        # limit. Items run in the order they're popped, and may push more.
+        work = [(self._visit_statement, node, result)]
+        while work:
+            function, *args = work.pop()
+            function(work, *args)
+
+    def _visit_statement(self, work, node, result):
+        # Temporaries are only live within a statement
+        work.append((self._restore_temps, self._temps))
+
+        if isinstance(node, SuiteNode):
+            if not node.statements:
+                if result is not None:
+                    self._op(MOVE, result, self._constant(0))
+                return
+            work.append((self._visit_statement, node.statements[-1], result))
+            for i in reversed(node.statements[:-1]):
+                work.append((self._visit_statement, i, None))
+            return
+
+        if isinstance(node, SkipNode):
+            self._finish_statement(work, result)
+        elif isinstance(node, AssignNode):
+            var = self._variable(node.name)
+            value = self.expr(node.value, var)
+            if value != var:
+                self._op(MOVE, var, value)
+            if node.name not in self._defined:
+                self._op(MARK, var)
+                self._defined.add(node.name)
+            self._finish_statement(work, result)
+        elif isinstance(node, IfNode):
+            condition = self.expr(node.condition)
+            slot = self._jump(JUMP_IF_FALSE, condition)
+            defined = self._defined
+            self._defined = set(defined)
+            work.append((self._finish_statement, result))
+            work.append((self._else, node, slot, defined))
+            work.append((self._visit_statement, node.body, None))
+        elif (
+            isinstance(node, WhileNode)
+            and not isinstance(node, InductionLoopNode)
+        ):
+            work.append((self._finish_statement, result))
+            self._while(work, node)
+        else:
+            value = self.expr(node, result)
+            if result is not None and value != result:
+                self._op(MOVE, result, value)
+
+    def _restore_temps(self, work, base):
+        self._temps = base
+
+    def _finish_statement(self, work, result):
+        if result is not None:
+            self._op(MOVE, result, self._constant(None))
+
+    def _else(self, work, node, slot, defined):
+        after = self._defined
+        self._defined = set(defined)
+        if node.else_body is not None:
+            end = self._emit_jump(JUMP)
+            self._patch(slot)
+            work.append((self._finish_if, end, after))
+            work.append((self._visit_statement, node.else_body, None))
+        else:
+            self._patch(slot)
+            self._defined &= after
+
+    def _finish_if(self, work, end, after):
+        self._patch(end)
+        self._defined &= after
+
+    def _while(self, work, node):
+        # The loop is rotated so each iteration costs a single conditional
+        # jump, with the presence of anything the body always assigns
+        # recorded once on entry rather than on every iteration:
+        #
+        #     cond; JUMP_IF_FALSE end; MARK ...
+        #     body: <body>; JUMP_IF_<cond> body
+        #     end:
+        defined = self._defined
+        calls = id(node) in self._calling
+
+        condition = self.expr(node.condition)
+        exit_slot = self._jump(JUMP_IF_FALSE, condition)
+        self._defined = set() if calls else set(defined)
+        if not calls:
+            for name in leading_assigns(node.body):
+                if name not in self._defined:
+                    self._op(MARK, self._variable(name))
+                    self._defined.add(name)
+
+        work.append((
+            self._finish_while, node, self._label(), exit_slot,
+            set() if calls else defined,
+        ))
+        work.append((self._visit_statement, node.body, None))
+
+    def _finish_while(self, work, node, body, exit_slot, defined):
+        if (
+            isinstance(node.condition, CmpNode)
+            and node.condition.mode in CMP_JUMP_OPCODES
+        ):
+            # Fuse the back-edge comparison and branch into one instruction
+            op = CMP_JUMP_OPCODES[node.condition.mode]
+            operands = (
+                self.expr(node.condition.lhs), self.expr(node.condition.rhs)
+            )
+        else:
+            op, operands = JUMP_IF_TRUE, (self.expr(node.condition), )
+        self._back_edges.append(self._label())
+        self._op(op, *operands)
+        self._code.append(body)
+        self._patch(exit_slot)
+
+        self._defined = defined
+
+    def _find_calls(self, ast):
+        # Found for every statement in one pass from the innermost out, as
+        # checking each loop's body separately would take time quadratic in
+        # how deeply loops are nested
+        for node in reversed(list(statements(ast))):
+            if isinstance(node, SuiteNode):
+                nested = node.statements
+            elif isinstance(node, IfNode):
+                nested = (node.body, node.else_body)
+            elif isinstance(node, WhileNode):
+                nested = (node.body, )
+            else:
+                nested = ()
+            if any(id(i) in self._calling for i in nested) or not all(
+                map(self._native, evaluated(node))
+            ):
+                self._calling.add(id(node))
+
+    def compile(self, ast):
+        self._find_calls(ast)
+        result = self._temp()
+        self.statement(ast, result)
+        self._emit(HALT)
+
+        n_vars = len(self._names)
+        n_consts = len(self._constant_values)
+        offsets = {"v": 0, "c": n_vars, "t": n_vars + n_consts}
+        for slot, (kind, index) in self._fixups:
+            self._code[slot] = offsets[kind] + index
+
+        registers = (
+            [0] * n_vars + self._constant_values + [None] * self._max_temps
+        )
+        names = sorted(self._names, key=self._names.get)
+        return Program(
+            self._code, registers, names, self._calls, offsets["t"],
+            self._back_edges,
+        )
+
+
+def compile_vm(ast):
+    return Compiler().compile(ast)